@@ -1,37 +1,25 @@
-import json
 import os
 import sys
+import argparse
 import ROOT
-import numpy as np
 from re import search
-from time import mktime
-from datetime import datetime
 import time
-import matplotlib.pyplot as plt
-import math
-import statistics
 
-# Finding ROOT files in directories
-def find_root_files_in_directories():
-    root_files = []
-    current_dir = os.getcwd()
-
-    for dirpath, dirnames, filenames in os.walk(current_dir):
-        if dirpath != current_dir:
-            for file in filenames:
-                if file.endswith(".root"):
-                    full_path = os.path.join(dirpath, file)
-                    root_files.append(full_path)
-
-    return root_files
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from results_catalog import find_root_files
+from root_output import RootOutput, DEFAULT_COMPRESSION
+from fit_models import get_model
 
 if __name__ == "__main__":
+    argParser = argparse.ArgumentParser(description='Fit the corrected ToA distributions')
+    argParser.add_argument('--compression', action='store', default=DEFAULT_COMPRESSION, type=str, help='Compression of the output ROOT files as algorithm:level')
+    args = argParser.parse_args()
     start_time = time.time()
     testdraw = False
     ROOT.gStyle.SetOptStat(0)
     charges = [5,15,20,30]
     # Extract list of ROOT files
-    root_files = find_root_files_in_directories()
+    root_files = find_root_files(kind='toa_tot')
     if not root_files:
         print("No ROOT files found in the subdirectories.")
         sys.exit(1)
@@ -48,7 +36,8 @@ if __name__ == "__main__":
         module = 21
         if fluence in ['0e14','15e14']:
             module = 43
-        roottemp = ROOT.TFile(file,"UPDATE")
+        roottemp = ROOT.TFile(file,"READ")
+        output = RootOutput(file, args.compression, update=True)
         path = file.replace(filename,'')
         filename = filename.replace('.root','')
 
@@ -65,7 +54,8 @@ if __name__ == "__main__":
                 toa_distr.DrawCopy()
                 min = 100
                 max = 250 if module==43 else 300
-                fitfunc = ROOT.TF1(f'fitfunc','gaus(0)',min,max)
+                fitfunc = get_model("gaus", min, max, 'fitfunc')
                 fit_result = toa_distr.Fit(fitfunc,'RS')
-                toa_distr.Write(distr_name,ROOT.TObject.kOverwrite)
-        roottemp.Close()
\ No newline at end of file
+                output.add(toa_distr, distr_name)
+        roottemp.Close()
+        output.write()
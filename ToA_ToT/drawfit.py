@@ -1,13 +1,5 @@
 import json
-import os
-import ROOT
-import numpy as np
-from re import search
-from time import mktime
-from datetime import datetime
 import matplotlib.pyplot as plt
-import math
-import statistics
 
 # Main part of the script
 if __name__ == "__main__":
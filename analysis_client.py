@@ -0,0 +1,75 @@
+import json
+import os
+import sys
+import socket
+import argparse
+
+# Thin client of analysis_server.py: sends one job to the server through its Unix socket and prints the answer.
+# It imports nothing heavy, so a request costs a few ms on top of the job itself.
+#   python3 analysis_client.py plot --low_temp 1 --xvar current --yvar HM_left --group_plot
+#   python3 analysis_client.py run toatot_root.py --sens FBK_6e14
+#   python3 analysis_client.py fit --series FBK_6e14_-20C --fitter numpy
+#   python3 analysis_client.py stats
+
+SOCKET_PATH = "./module_test/cache/analysis.sock"
+
+# Sends a request and returns the decoded answer, one json document per line each way
+def send_request(request: dict, socket_path: str = SOCKET_PATH):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(socket_path)
+        client.sendall(json.dumps(request).encode() + b"\n")
+        with client.makefile('r') as answer:
+            return json.loads(answer.readline())
+
+# Main part of the script
+if __name__ == "__main__":
+    argParser = argparse.ArgumentParser(description='Send a job to the resident analysis server')
+    argParser.add_argument('--socket', action='store', default=SOCKET_PATH, type=str, help='Unix socket of the server')
+    jobs = argParser.add_subparsers(dest='job', required=True)
+
+    plot = jobs.add_parser('plot', help='Draw one or all the plots of plot_results_qinj_MDthesis.py')
+    plot.add_argument('--xvar', action='store', default='current', type=str, help='Define x variable to plot')
+    plot.add_argument('--yvar', action='store', default='HM_left', type=str, help='Define y variable to plot')
+    plot.add_argument('--low_temp', action='store', default=1, type=int, help='Select RoomT or Cold measurements')
+    plot.add_argument('--group_plot', action='store_true', default=False, help='Plot average and std values instead of scatter')
+    plot.add_argument('--all_plots', action='store_true', default=False, help='Draw every (low_temp, xvar, yvar, group_plot) combination')
+
+    fit = jobs.add_parser('fit', help='Fit run series with qinj_engine.py')
+    fit.add_argument('--config', action='store', default='qinj_series.json', type=str, help='JSON file describing the run series')
+    fit.add_argument('--series', action='store', nargs='+', default=None, type=str, help='Process only the series with these names')
+    fit.add_argument('--fitter', action='store', default='root', choices=['root', 'numpy'], help='Fitter of the S curve edges')
+    fit.add_argument('--matrix', action='store_true', default=False, help='Fit every pixel of each timestamp')
+    fit.add_argument('--refit', action='store_true', default=False, help='Ignore the cached fits')
+    fit.add_argument('--jobs', action='store', default=1, type=int, help='Number of worker processes fitting timestamps in parallel')
+
+    scan = jobs.add_parser('scan', help='Per-Vth mean and std of the ToA and ToT of a Qinj_scan json file')
+    scan.add_argument('path', action='store', type=str, help='Qinj_scan json file')
+
+    run = jobs.add_parser('run', help='Run a script inside the server, with its modules already imported')
+    run.add_argument('script', action='store', type=str, help='Script to run, e.g. toatot_root.py or ToA_ToT/fit_correction.py')
+    run.add_argument('args', nargs=argparse.REMAINDER, help='Arguments of the script')
+    run.add_argument('--cwd', action='store', default=None, type=str, help='Directory to run the script from (default: the directory of the client)')
+
+    jobs.add_parser('stats', help='Show the content of the server caches')
+    jobs.add_parser('clear', help='Empty the server caches')
+    jobs.add_parser('shutdown', help='Stop the server')
+    args = argParser.parse_args()
+
+    request = {key: value for key, value in vars(args).items() if key != 'socket'}
+    if args.job == 'run':
+        request['cwd'] = os.path.abspath(args.cwd or os.getcwd())
+        request['script'] = os.path.abspath(args.script)
+    try:
+        answer = send_request(request, args.socket)
+    except (FileNotFoundError, ConnectionRefusedError):
+        print(f"No analysis server listening on {args.socket}, start it with: python3 analysis_server.py")
+        sys.exit(1)
+
+    if answer.get("output"):
+        print(answer["output"], end='' if answer["output"].endswith('\n') else '\n')
+    if not answer["ok"]:
+        print(answer["error"])
+        sys.exit(1)
+    if answer.get("result") is not None:
+        print(json.dumps(answer["result"], indent=4))
+    print(f"Done in {answer['elapsed']:.3f} s")
@@ -0,0 +1,251 @@
+import io
+import json
+import os
+import sys
+import time
+import runpy
+import argparse
+import traceback
+import socketserver
+from collections import OrderedDict
+from contextlib import contextmanager, redirect_stdout, redirect_stderr
+from analysis_client import SOCKET_PATH
+from lazy import ROOT, plt, is_loaded
+import scan_cache
+import results_io
+from scan_cache import CACHE_DIR, load_scan
+from ragged import Ragged, ragged_stats
+from results_io import QINJ_BRANCHES, read_results
+from fit_cache import FitCache
+import qinj_engine
+import plot_results_qinj_MDthesis as thesis_plots
+
+# Resident analysis server: a long-running process that keeps PyROOT, matplotlib and the analysis modules imported
+# and holds LRU caches of the results trees, of the decoded scans and of the fit results, keyed by file mtime and size.
+# Jobs arrive through a Unix socket from analysis_client.py, one json request per connection, and run one at a time
+# (ROOT and pyplot are not thread safe). Their printout is captured and sent back with the result.
+
+class LRUCache:
+    def __init__(self, maxsize: int = 64):
+        self.maxsize = maxsize
+        self.items = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    # Cached value of a key, computed with load() on a miss; None values are not cached
+    def get(self, key, load):
+        if key in self.items:
+            self.items.move_to_end(key)
+            self.hits += 1
+            return self.items[key]
+        self.misses += 1
+        value = load()
+        if value is not None:
+            self.put(key, value)
+        return value
+
+    def put(self, key, value):
+        self.items[key] = value
+        self.items.move_to_end(key)
+        while len(self.items) > self.maxsize:
+            self.items.popitem(last=False)
+
+    def clear(self):
+        self.items.clear()
+
+    def stats(self):
+        return {"size": len(self.items), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses}
+
+# Identity of a file's content for the caches: a rewritten file gets a new key
+def file_key(filename: str):
+    stat = os.stat(filename)
+    return (os.path.abspath(filename), stat.st_mtime_ns, stat.st_size)
+
+# Fit cache of qinj_engine.py with an in-memory layer, so repeated fits do not even read the cached entries
+class ResidentFitCache(FitCache):
+    def __init__(self, cache_dir: str, memory: LRUCache):
+        super().__init__(cache_dir)
+        self.memory = memory
+
+    def load(self, key: str):
+        return self.memory.get(key, lambda: FitCache.load(self, key))
+
+    def store(self, key: str, result, png_source: str = None):
+        FitCache.store(self, key, result, png_source)
+        self.memory.put(key, result)
+
+class AnalysisService:
+    def __init__(self, cache_size: int = 64, cache_dir: str = CACHE_DIR):
+        self.cache_dir = cache_dir
+        self.trees = LRUCache(cache_size)
+        self.scans = LRUCache(cache_size)
+        self.fits = LRUCache(cache_size)
+        self.fit_caches = {}
+
+    # Cached versions of results_io.read_results and scan_cache.load_scan, same arguments
+    def read_results(self, file_name: str, columns: tuple = QINJ_BRANCHES, tree_name: str = "qinj_results", backend: str = "auto"):
+        key = file_key(file_name) + (tuple(columns), tree_name, backend)
+        return self.trees.get(key, lambda: read_results(file_name, columns, tree_name, backend))
+
+    def load_scan(self, json_path: str, cache_dir: str = CACHE_DIR):
+        key = file_key(json_path) + (os.path.abspath(cache_dir),)
+        return self.scans.get(key, lambda: load_scan(json_path, cache_dir))
+
+    # Replaces the loaders with the cached ones in every imported module for the duration of a job,
+    # including the names bound by "from ... import" in the scripts run by job_run.
+    # This module keeps the originals, called by the cached versions on a miss
+    @contextmanager
+    def cached_loaders(self):
+        loaders = {scan_cache.load_scan: self.load_scan, results_io.read_results: self.read_results}
+        replaced = []
+        for module in list(sys.modules.values()):
+            if module is sys.modules[__name__]:
+                continue
+            for name in ("load_scan", "read_results"):
+                original = getattr(module, name, None)
+                if original in loaders:
+                    setattr(module, name, loaders[original])
+                    replaced.append((module, name, original))
+        try:
+            yield
+        finally:
+            for module, name, original in replaced:
+                setattr(module, name, original)
+
+    def job_plot(self, request: dict):
+        file_data = thesis_plots.load_file_data(self.read_results)
+        if request.get("all_plots"):
+            plots = thesis_plots.PLOT_MATRIX
+        else:
+            x_plot = request.get("xvar") if request.get("xvar") in ['current', 'charge'] else "current"
+            y_plot = request.get("yvar") if request.get("yvar") in ['width', 'HM_left'] else "HM_left"
+            plots = [(bool(request.get("low_temp", 1)), x_plot, y_plot, bool(request.get("group_plot")))]
+        for plot in plots:
+            thesis_plots.draw_plot(file_data, *plot)
+        return {"plots": len(plots), "files": len(file_data)}
+
+    def job_fit(self, request: dict):
+        config = qinj_engine.load_config(request.get("config", "qinj_series.json"))
+        dir_path = config.get("dir_path", "./module_test/outputs/")
+        results_path = config.get("results_path", "./module_test/results/")
+        series_list = [series for series in config["series"] if not request.get("series") or series["name"] in request["series"]]
+        cache_dir = config.get("cache_dir")
+        if cache_dir:
+            series_list = [dict(series, cache_dir=cache_dir) for series in series_list]
+        cache_dir = cache_dir or self.cache_dir
+        if cache_dir not in self.fit_caches:
+            self.fit_caches[cache_dir] = ResidentFitCache(cache_dir, self.fits)
+        fit_cache = None if request.get("refit") else self.fit_caches[cache_dir]
+        outfilenames = qinj_engine.process_series(series_list, dir_path, results_path, request.get("jobs", 1), True,
+                                                  request.get("fitter", "root"), request.get("matrix", False), cache_dir, fit_cache)
+        return {"outfiles": outfilenames}
+
+    def job_scan(self, request: dict):
+        def load():
+            scan = self.load_scan(request["path"])
+            (mean_a, mean_t), (std_a, std_t), count, vth = ragged_stats(Ragged.from_scan(scan, 'toa'), Ragged.from_scan(scan, 'tot'))
+            return {"vth": vth.tolist(), "count": count.tolist(), "toa_mean": mean_a.tolist(), "toa_std": std_a.tolist(),
+                    "tot_mean": mean_t.tolist(), "tot_std": std_t.tolist()}
+        return self.scans.get(("stats",) + file_key(request["path"]), load)
+
+    # Runs a script as __main__ from its own directory layout, reusing the modules already imported by the server
+    # and reading the scans and results trees through the server caches
+    def job_run(self, request: dict):
+        script = request["script"]
+        old_argv, old_path, old_cwd = sys.argv, list(sys.path), os.getcwd()
+        sys.argv = [script] + list(request.get("args", []))
+        sys.path.insert(0, os.path.dirname(script))
+        os.chdir(request.get("cwd", old_cwd))
+        try:
+            with self.cached_loaders():
+                runpy.run_path(script, run_name="__main__")
+        except SystemExit as exit:
+            if exit.code not in (None, 0):
+                raise RuntimeError(f"{os.path.basename(script)} exited with code {exit.code}")
+        finally:
+            sys.argv, sys.path[:] = old_argv, old_path
+            os.chdir(old_cwd)
+            # Scripts that drew nothing do not pay the matplotlib import
+            if is_loaded(plt):
+                plt.close('all')
+        return None
+
+    def job_stats(self, request: dict):
+        return {"trees": self.trees.stats(), "scans": self.scans.stats(), "fits": self.fits.stats()}
+
+    def job_clear(self, request: dict):
+        for cache in (self.trees, self.scans, self.fits):
+            cache.clear()
+        return self.job_stats(request)
+
+    # Runs one request and returns the answer sent to the client
+    def handle(self, request: dict):
+        start_time = time.time()
+        output = io.StringIO()
+        answer = {"ok": True, "result": None}
+        try:
+            job = getattr(self, f"job_{request.get('job')}", None)
+            if job is None:
+                raise ValueError(f"Unknown job {request.get('job')}")
+            with redirect_stdout(output), redirect_stderr(output):
+                answer["result"] = job(request)
+        except Exception:
+            answer["ok"] = False
+            answer["error"] = traceback.format_exc()
+        answer["output"] = output.getvalue()
+        answer["elapsed"] = time.time() - start_time
+        return answer
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            return
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError(f"expected a json object, got {type(request).__name__}")
+        except ValueError as error:
+            # Answer anyway, so the client does not wait for a reply that never comes
+            answer = {"ok": False, "result": None, "error": f"Malformed request: {error}", "output": "", "elapsed": 0.}
+            print(f"{time.strftime('%H:%M:%S')} malformed request: {error}")
+            self.wfile.write(json.dumps(answer).encode() + b"\n")
+            return
+        if request.get("job") == "shutdown":
+            self.server.running = False
+            answer = {"ok": True, "result": None, "output": "Server stopped\n", "elapsed": 0.}
+        else:
+            answer = self.server.service.handle(request)
+            print(f"{time.strftime('%H:%M:%S')} {request.get('job')}: {'ok' if answer['ok'] else 'failed'} in {answer['elapsed']:.3f} s")
+        self.wfile.write(json.dumps(answer).encode() + b"\n")
+
+# Main part of the script
+if __name__ == "__main__":
+    argParser = argparse.ArgumentParser(description='Resident analysis server keeping ROOT and the loaded data in memory')
+    argParser.add_argument('--socket', action='store', default=SOCKET_PATH, type=str, help='Unix socket to listen on')
+    argParser.add_argument('--cache_size', action='store', default=64, type=int, help='Number of entries of each LRU cache')
+    argParser.add_argument('--cache_dir', action='store', default=CACHE_DIR, type=str, help='Directory of the fit cache')
+    argParser.add_argument('--no_root', action='store_true', default=False, help='Do not initialize PyROOT at startup')
+    args = argParser.parse_args()
+
+    plt.switch_backend('Agg')
+    if not args.no_root:
+        # Pays the cling start-up once, for all the jobs to come
+        ROOT.gROOT.SetBatch(True)
+        ROOT.gErrorIgnoreLevel = 3000
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.socket)), exist_ok=True)
+    if os.path.exists(args.socket):
+        os.remove(args.socket)
+    with socketserver.UnixStreamServer(args.socket, RequestHandler) as server:
+        os.chmod(args.socket, 0o600)
+        server.service = AnalysisService(args.cache_size, args.cache_dir)
+        server.running = True
+        print(f"Analysis server listening on {args.socket}")
+        try:
+            while server.running:
+                server.handle_request()
+        except KeyboardInterrupt:
+            pass
+    os.remove(args.socket)
+    print("Analysis server stopped")
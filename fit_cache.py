@@ -0,0 +1,98 @@
+import hashlib
+import json
+import os
+import shutil
+import numpy as np
+from scan_cache import CACHE_DIR
+
+# Cache of the per-timestamp results of qinj_engine.py.
+# A timestamp is keyed by the SHA-256 of its input json files and of the settings used to fit it
+# (fit function, fitter, windows, fit options, current, run conditions), so that it is refit only when one of them changes.
+# Entries are stored in <cache_dir>/fits/:
+#   <key>.json    rows of process_timestamp
+#   <key>.npz     columns of process_timestamp_matrix
+#   <key>.png     S curve plot saved with the rows
+#   digests.json  size, mtime and hash of the input files, so unchanged files are not read again
+
+# Bump when the fit code changes in a way that changes the results of unchanged inputs
+CACHE_VERSION = 3
+
+def file_digest(filename: str):
+    sha = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+class FitCache:
+    def __init__(self, cache_dir: str = CACHE_DIR):
+        self.path = os.path.join(cache_dir, "fits")
+        os.makedirs(self.path, exist_ok=True)
+        self.digests_file = os.path.join(self.path, "digests.json")
+        try:
+            with open(self.digests_file, 'r') as f:
+                self.digests = json.load(f)
+        except (OSError, ValueError):
+            self.digests = {}
+
+    # Hash of a file, read again only if its size or mtime changed
+    def digest(self, filename: str):
+        stat = os.stat(filename)
+        key = os.path.abspath(filename)
+        known = self.digests.get(key)
+        if known is None or known[:2] != [stat.st_mtime_ns, stat.st_size]:
+            known = [stat.st_mtime_ns, stat.st_size, file_digest(filename)]
+            self.digests[key] = known
+        return known[2]
+
+    # Key of a timestamp job: hash of the json files below its directory and of the fit settings
+    def key(self, filepath: str, settings: dict):
+        inputs = []
+        for dirpath, dirnames, filenames in os.walk(filepath):
+            dirnames.sort()
+            for file in sorted(filenames):
+                if file.endswith(".json"):
+                    inputs.append((os.path.relpath(os.path.join(dirpath, file), filepath), self.digest(os.path.join(dirpath, file))))
+        content = json.dumps({"version": CACHE_VERSION, "settings": settings, "inputs": inputs}, sort_keys=True, default=str)
+        return hashlib.sha256(content.encode()).hexdigest()
+
+    # Cached result of a key, None if missing
+    def load(self, key: str):
+        base = os.path.join(self.path, key)
+        if os.path.isfile(base + ".json"):
+            with open(base + ".json", 'r') as f:
+                return json.load(f)
+        if os.path.isfile(base + ".npz"):
+            with np.load(base + ".npz") as data:
+                return {name: data[name] for name in data.files}
+        return None
+
+    # Stores the result of a key, with a copy of the plot saved in png_source
+    def store(self, key: str, result, png_source: str = None):
+        base = os.path.join(self.path, key)
+        if png_source is not None and os.path.isfile(png_source):
+            shutil.copyfile(png_source, base + ".png")
+        # The result is written last through a temporary file, so an interrupted entry is never taken as valid
+        tmpname = f"{base}.{os.getpid()}.tmp"
+        if isinstance(result, dict):
+            with open(tmpname, 'wb') as f:
+                np.savez(f, **result)
+            os.replace(tmpname, base + ".npz")
+        else:
+            with open(tmpname, 'w') as f:
+                json.dump(result, f)
+            os.replace(tmpname, base + ".json")
+
+    # Copies the cached plot of a key to png_target, returns False if there is none
+    def restore_plot(self, key: str, png_target: str):
+        png = os.path.join(self.path, key + ".png")
+        if not os.path.isfile(png):
+            return False
+        shutil.copyfile(png, png_target)
+        return True
+
+    def save(self):
+        tmpname = f"{self.digests_file}.{os.getpid()}.tmp"
+        with open(tmpname, 'w') as f:
+            json.dump(self.digests, f)
+        os.replace(tmpname, self.digests_file)
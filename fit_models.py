@@ -0,0 +1,41 @@
+from lazy import ROOT
+
+# Shared pool of the TF1 fit models.
+# Every model is built and compiled once per process and reused for each curve: get_model() sets its name, range and
+# parameters back to the state of a new TF1, so fits give the same results as with a fresh function. The functions
+# are kept out of the global list of ROOT, which does not grow with the number of curves. The copy stored by
+# Fit(..., '+') or Fit(..., 'S') in the histogram or graph keeps the name, range and parameters of that fit.
+#
+#   fitfunc = get_model("gaus", 100., 250., name=f"gaus_toa_{charge}")
+#   hist.Fit(fitfunc, 'RS')
+
+MODEL_FORMULAS = {
+    "gaus": "gaus",
+    "erf": "TMath::Erf((x-[0])/[1])*[2]+[3]",
+    "erfc": "TMath::Erfc((x-[0])/[1])*[2]+[3]",
+    "pol2": "[a0]+[a1]*x+[a2]*pow(x,2)"
+}
+
+_pool = {}
+
+# TF1 of a model ready for a new fit on [low, high]; slot gives separate functions of the same model used at the same time
+def get_model(model: str, low: float, high: float, name: str = None, slot: str = ""):
+    key = (model, slot)
+    function = _pool.get(key)
+    if function is None:
+        function = ROOT.TF1(f"pool_{model}{'_' + slot if slot else ''}", MODEL_FORMULAS[model], low, high, ROOT.TF1.EAddToList.kNo)
+        _pool[key] = function
+    if name:
+        function.SetName(name)
+    function.SetRange(low, high)
+    for par in range(function.GetNpar()):
+        function.SetParameter(par, 0.)
+        function.SetParError(par, 0.)
+    return function
+
+# Number of functions in the pool, whatever the number of fits done with them
+def pool_size():
+    return len(_pool)
+
+def clear_pool():
+    _pool.clear()
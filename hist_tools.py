@@ -0,0 +1,82 @@
+import ROOT
+import numpy as np
+
+# Helpers to move data between NumPy arrays and ROOT histograms without one PyROOT call per entry
+
+# Largest number of entries passed to a single FillN call (ROOT takes an Int_t)
+FILL_CHUNK = 2**30
+
+def as_buffer(values: np.array):
+    return np.ascontiguousarray(values, dtype=np.float64)
+
+# Fills a TH1 with all the values at once, same result as calling Fill for each value
+def fill_th1(hist: ROOT.TH1, x: np.array, w: np.array = None):
+    x = as_buffer(x)
+    w = as_buffer(np.ones(len(x)) if w is None else w)
+    for start in range(0, len(x), FILL_CHUNK):
+        stop = min(start + FILL_CHUNK, len(x))
+        hist.FillN(stop - start, x[start:stop], w[start:stop])
+    return hist
+
+# Fills a TH2 with all the (x, y) pairs at once, same result as calling Fill for each pair
+def fill_th2(hist: ROOT.TH2, x: np.array, y: np.array, w: np.array = None):
+    x = as_buffer(x)
+    y = as_buffer(y)
+    if len(x) != len(y):
+        raise ValueError(f"fill_th2 needs arrays of the same length, got {len(x)} and {len(y)}")
+    w = as_buffer(np.ones(len(x)) if w is None else w)
+    for start in range(0, len(x), FILL_CHUNK):
+        stop = min(start + FILL_CHUNK, len(x))
+        hist.FillN(stop - start, x[start:stop], y[start:stop], w[start:stop])
+    return hist
+
+# Writable NumPy view of the bin contents of a TH2D, under/overflow included, indexed as [y_bin, x_bin]
+# Changes to the view modify the histogram directly
+def th2_view(hist: ROOT.TH2D):
+    n_x = hist.GetNbinsX() + 2
+    n_y = hist.GetNbinsY() + 2
+    buffer = hist.GetArray()
+    buffer.reshape((n_x * n_y,))
+    return np.frombuffer(buffer, dtype=np.float64, count=n_x * n_y).reshape(n_y, n_x)
+
+# Removes noise from a ToA vs ToT histogram: bins with a single count and bins outside the diagonal band
+# y_bin < band_low * x_bin or y_bin > FindBin(y_high) + band_high * x_bin are set to zero
+def clean_toa_tot(hist2d: ROOT.TH2D, y_high: float, band_low: float = 0.5, band_high: float = 1.2, single_count: float = 1.):
+    contents = th2_view(hist2d)
+    y_bin = np.arange(contents.shape[0])[:, None]
+    x_bin = np.arange(contents.shape[1])[None, :]
+    inner = (x_bin >= 1) & (x_bin <= hist2d.GetNbinsX()) & (y_bin >= 1) & (y_bin <= hist2d.GetNbinsY())
+    y_high_bin = hist2d.GetYaxis().FindBin(y_high)
+    noise = (contents == single_count) | (y_bin > y_high_bin + band_high * x_bin) | (y_bin < band_low * x_bin)
+    contents[inner & noise] = 0.
+    hist2d.ResetStats()
+    return hist2d
+
+# Profile of a TH2D along x computed from the bin contents, as TH2::ProfileX with the default error option:
+# returns bin centres, mean y, error on the mean and sum of weights of every x bin (under/overflow excluded)
+def profile_x(hist2d: ROOT.TH2D):
+    contents = th2_view(hist2d)[1:-1, 1:-1]
+    x_axis = hist2d.GetXaxis()
+    y_axis = hist2d.GetYaxis()
+    x_centers = np.array([x_axis.GetBinCenter(i) for i in range(1, hist2d.GetNbinsX() + 1)])
+    y_centers = np.array([y_axis.GetBinCenter(i) for i in range(1, hist2d.GetNbinsY() + 1)])[:, None]
+    sumw = contents.sum(axis=0)
+    sumw2 = (contents * contents).sum(axis=0)
+    with np.errstate(all='ignore'):
+        mean = np.where(sumw > 0, (contents * y_centers).sum(axis=0) / sumw, 0.)
+        spread = np.sqrt(np.clip((contents * y_centers * y_centers).sum(axis=0) / sumw - mean * mean, 0., None))
+        error = np.where(sumw > 0, spread / np.sqrt(sumw * sumw / sumw2), 0.)
+    return x_centers, mean, error, sumw
+
+# Closed-form weighted least squares fit of y = a0 + a1*x + a2*x^2, points with zero error are skipped as in ROOT
+# Returns the parameters, their errors, the chi2 and the number of degrees of freedom
+def fit_pol2(x: np.array, y: np.array, error: np.array):
+    used = error > 0
+    x, y, weight = x[used], y[used], 1. / error[used]**2
+    design = np.stack([np.ones_like(x), x, x * x], axis=1)
+    normal = design.T @ (design * weight[:, None])
+    covariance = np.linalg.inv(normal)
+    parval = covariance @ (design.T @ (weight * y))
+    residuals = y - design @ parval
+    chi2 = float((weight * residuals * residuals).sum())
+    return parval, np.sqrt(np.diag(covariance)), chi2, int(used.sum()) - 3
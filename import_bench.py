@@ -0,0 +1,78 @@
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+# Import-time benchmark of the analysis modules.
+# Every module is imported in a fresh interpreter, as when a script or a pipeline stage starts, and the
+# wall time of the import is measured (best of --repeat). With --budget the times are compared to the
+# limits stored in a json file and the script exits with an error if one of them is exceeded.
+
+MODULES = [
+    "qinj_engine", "scurve_fit", "scan_cache", "run_index", "fit_cache", "results_io", "results_catalog",
+    "ragged", "timewalk", "plot_results_qinj", "plot_results_qinj_MDthesis", "pipeline",
+    "toatot_root", "toatot_fused", "timewalk_fit", "root_output", "fit_models", "hist_tools", "ToA_ToT/fit_correction", "ToA_ToT/distrib_toa", "ToA_ToT/drawfit"
+]
+# Reports which heavy modules were loaded by the import
+HEAVY_MODULES = ("ROOT", "matplotlib.pyplot", "scipy.optimize", "uproot")
+
+PROBE = """
+import sys, time, json
+sys.path.insert(0, {path!r})
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"time": elapsed, "heavy": [name for name in {heavy!r} if name in sys.modules]}}))
+"""
+
+# Imports a module in a new interpreter and returns the import time and the heavy modules it loaded
+def time_import(module: str, base_dir: str):
+    path, name = os.path.split(module)
+    probe = PROBE.format(path=os.path.join(base_dir, path), module=name, heavy=HEAVY_MODULES)
+    process = subprocess.run([sys.executable, "-c", probe], cwd=base_dir, capture_output=True, text=True)
+    if process.returncode != 0:
+        return None, process.stderr.strip().splitlines()[-1] if process.stderr.strip() else "import failed"
+    result = json.loads(process.stdout.strip().splitlines()[-1])
+    return result["time"], result["heavy"]
+
+# Main part of the script
+if __name__ == "__main__":
+    argParser = argparse.ArgumentParser(description='Measure the import time of the analysis modules in fresh interpreters')
+    argParser.add_argument('--modules', action='store', nargs='+', default=MODULES, type=str, help='Modules to import, paths relative to the repository')
+    argParser.add_argument('--repeat', action='store', default=3, type=int, help='Number of imports per module, the best time is kept')
+    argParser.add_argument('--budget', action='store', default=None, type=str, help='JSON file with the maximum import time in seconds of each module')
+    argParser.add_argument('--save_budget', action='store', default=None, type=str, help='Write the measured times, with a 50%% margin, as a budget file')
+    args = argParser.parse_args()
+
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    times = {}
+    print(f"{'Module':<30}{'Import (s)':>12}  Heavy modules loaded")
+    for module in args.modules:
+        best, heavy = None, []
+        for _ in range(args.repeat):
+            elapsed, info = time_import(module, base_dir)
+            if elapsed is None:
+                heavy = info
+                break
+            best = elapsed if best is None else min(best, elapsed)
+            heavy = info
+        if best is None:
+            print(f"{module:<30}{'failed':>12}  {heavy}")
+            continue
+        times[module] = best
+        print(f"{module:<30}{best:>12.3f}  {', '.join(heavy) if heavy else '-'}")
+
+    if args.save_budget:
+        with open(args.save_budget, 'w') as f:
+            json.dump({module: round(1.5 * elapsed + 0.05, 3) for module, elapsed in times.items()}, f, indent=4)
+        print(f"Budget saved to {args.save_budget}")
+    if args.budget:
+        with open(args.budget, 'r') as f:
+            budget = json.load(f)
+        over = [module for module, limit in budget.items() if module in times and times[module] > limit]
+        for module in over:
+            print(f"Import of {module} took {times[module]:.3f} s, over its budget of {budget[module]:.3f} s")
+        if over:
+            raise SystemExit(1)
+        print("All the imports are within budget")
@@ -0,0 +1,52 @@
+import importlib
+import sys
+
+# Deferred imports of the heavy modules (PyROOT, matplotlib, scipy).
+# Importing PyROOT starts cling and takes seconds, matplotlib.pyplot and scipy.optimize a few hundred ms:
+# a LazyModule stands in for the module and imports it the first time one of its attributes is used,
+# so scripts and code paths that never touch it do not pay for it.
+#
+#   from lazy import ROOT, plt
+#   ROOT.TFile.Open(...)   # PyROOT is imported here
+
+class LazyModule:
+    def __init__(self, name: str):
+        self.__dict__["_name"] = name
+        self.__dict__["_module"] = None
+
+    def _load(self):
+        module = self.__dict__["_module"]
+        if module is None:
+            module = importlib.import_module(self.__dict__["_name"])
+            self.__dict__["_module"] = module
+        return module
+
+    def __getattr__(self, attr: str):
+        return getattr(self._load(), attr)
+
+    def __setattr__(self, attr: str, value):
+        setattr(self._load(), attr, value)
+
+    def __repr__(self):
+        state = "loaded" if self.__dict__["_module"] is not None else "not loaded"
+        return f"<lazy module '{self.__dict__['_name']}' ({state})>"
+
+def lazy_import(name: str):
+    return LazyModule(name)
+
+# True if the module has been imported, by a LazyModule or by a regular import
+def is_loaded(module):
+    if isinstance(module, LazyModule):
+        return module.__dict__["_module"] is not None or module.__dict__["_name"] in sys.modules
+    return True
+
+# Imports an optional dependency, None if it is not installed
+def optional_import(name: str):
+    try:
+        return importlib.import_module(name)
+    except ImportError:
+        return None
+
+ROOT = lazy_import("ROOT")
+plt = lazy_import("matplotlib.pyplot")
+optimize = lazy_import("scipy.optimize")
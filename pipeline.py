@@ -0,0 +1,190 @@
+import hashlib
+import json
+import os
+import time
+import shlex
+import argparse
+import subprocess
+from glob import glob
+from fnmatch import fnmatch
+from itertools import product
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from scan_cache import CACHE_DIR
+
+# Runs the analysis stages described in pipeline.json as a dependency graph.
+# A stage has a command (run from its cwd), the stages it depends on and the files it reads.
+# Its signature hashes the command, the size and mtime of its input files and the signatures of its dependencies:
+# a stage is run again only if its signature differs from the one of its last successful run,
+# so a change propagates to everything downstream of it. Independent stages run concurrently.
+# Stages with a "matrix" are expanded into one stage per combination of values, substituted in name and command.
+
+STATE_FILE = "pipeline_state.json"
+
+def load_stages(config: dict):
+    stages = {}
+    for stage in config["stages"]:
+        matrix = stage.get("matrix", {})
+        for values in product(*matrix.values()):
+            fields = dict(zip(matrix.keys(), values))
+            name = stage["name"].format(**fields)
+            if name in stages:
+                raise ValueError(f"Stage {name} is defined twice")
+            stages[name] = {
+                "name": name,
+                "command": stage["command"].format(**fields),
+                "cwd": stage.get("cwd", "."),
+                "deps": stage.get("deps", []),
+                "inputs": [pattern.format(**fields) for pattern in stage.get("inputs", [])]
+            }
+    # Dependencies may be patterns, e.g. "toatot_*"
+    for stage in stages.values():
+        deps = []
+        for pattern in stage["deps"]:
+            matched = [name for name in stages if fnmatch(name, pattern) and name != stage["name"]]
+            if not matched:
+                raise ValueError(f"Dependency {pattern} of stage {stage['name']} matches no stage")
+            deps.extend(name for name in matched if name not in deps)
+        stage["deps"] = deps
+    return stages
+
+# Stage names in an order where every stage comes after its dependencies
+def topological_order(stages: dict):
+    order = []
+    state = {}
+    def visit(name: str, path: tuple):
+        if state.get(name) == "done":
+            return
+        if state.get(name) == "visiting":
+            raise ValueError(f"Dependency cycle: {' -> '.join(path + (name,))}")
+        state[name] = "visiting"
+        for dep in stages[name]["deps"]:
+            visit(dep, path + (name,))
+        state[name] = "done"
+        order.append(name)
+    for name in stages:
+        visit(name, ())
+    return order
+
+# Selected stages together with everything they depend on
+def select_stages(stages: dict, patterns: list):
+    selected = set()
+    pending = [name for name in stages if any(fnmatch(name, pattern) for pattern in patterns)]
+    while pending:
+        name = pending.pop()
+        if name not in selected:
+            selected.add(name)
+            pending.extend(stages[name]["deps"])
+    return {name: stage for name, stage in stages.items() if name in selected}
+
+def stage_signature(stage: dict, dep_signatures: list):
+    inputs = []
+    for pattern in stage["inputs"]:
+        for filename in sorted(glob(pattern, recursive=True)):
+            if os.path.isfile(filename):
+                stat = os.stat(filename)
+                inputs.append((filename, stat.st_mtime_ns, stat.st_size))
+    content = json.dumps({"command": stage["command"], "cwd": stage["cwd"], "inputs": inputs, "deps": dep_signatures})
+    return hashlib.sha256(content.encode()).hexdigest()
+
+# Runs the command of a stage with its output in a log file, returns the exit code and the elapsed time
+def run_stage(stage: dict, logfile: str):
+    start_time = time.time()
+    with open(logfile, 'w') as log:
+        process = subprocess.run(shlex.split(stage["command"]), cwd=stage["cwd"], stdout=log, stderr=subprocess.STDOUT)
+    return process.returncode, time.time() - start_time
+
+class Pipeline:
+    def __init__(self, stages: dict, cache_dir: str = CACHE_DIR):
+        self.stages = stages
+        self.order = topological_order(stages)
+        self.state_file = os.path.join(cache_dir, STATE_FILE)
+        self.log_dir = os.path.join(cache_dir, "logs")
+        os.makedirs(self.log_dir, exist_ok=True)
+        try:
+            with open(self.state_file, 'r') as f:
+                self.state = json.load(f)
+        except (OSError, ValueError):
+            self.state = {}
+
+    def save_state(self):
+        tmpname = f"{self.state_file}.{os.getpid()}.tmp"
+        with open(tmpname, 'w') as f:
+            json.dump(self.state, f, indent=4)
+        os.replace(tmpname, self.state_file)
+
+    # Runs the out-of-date stages, at most n_jobs at a time, and returns {stage: (status, elapsed time)}
+    # status is "done", "up to date", "failed" or "blocked" (a dependency failed)
+    def run(self, n_jobs: int = 1, force: bool = False, dry_run: bool = False):
+        signatures = {}
+        report = {}
+        pending = list(self.order)
+        running = {}
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            while pending or running:
+                for name in list(pending):
+                    stage = self.stages[name]
+                    if any(dep not in report for dep in stage["deps"]):
+                        continue
+                    pending.remove(name)
+                    if any(report[dep][0] in ("failed", "blocked") for dep in stage["deps"]):
+                        report[name] = ("blocked", 0.)
+                        print(f"[blocked]    {name}")
+                        continue
+                    signatures[name] = stage_signature(stage, [signatures[dep] for dep in stage["deps"]])
+                    if not force and self.state.get(name) == signatures[name]:
+                        report[name] = ("up to date", 0.)
+                        print(f"[up to date] {name}")
+                        continue
+                    if dry_run:
+                        report[name] = ("done", 0.)
+                        print(f"[would run]  {name}: {stage['command']}")
+                        continue
+                    print(f"[start]      {name}: {stage['command']}")
+                    running[executor.submit(run_stage, stage, os.path.join(self.log_dir, name + ".log"))] = name
+                if not running:
+                    continue
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    returncode, elapsed = future.result()
+                    if returncode == 0:
+                        report[name] = ("done", elapsed)
+                        self.state[name] = signatures[name]
+                        self.save_state()
+                        print(f"[done]       {name} in {elapsed:.1f} s")
+                    else:
+                        report[name] = ("failed", elapsed)
+                        self.state.pop(name, None)
+                        self.save_state()
+                        print(f"[failed]     {name} with exit code {returncode} after {elapsed:.1f} s, see {os.path.join(self.log_dir, name + '.log')}")
+        return report
+
+# Main part of the script
+if __name__ == "__main__":
+    argParser = argparse.ArgumentParser(description='Run the analysis stages that are out of date, in dependency order')
+    argParser.add_argument('--config', action='store', default='pipeline.json', type=str, help='JSON file describing the stages')
+    argParser.add_argument('--stages', action='store', nargs='+', default=None, type=str, help='Run only these stages (patterns allowed) and their dependencies')
+    argParser.add_argument('--jobs', action='store', default=0, type=int, help='Number of stages running at the same time (0 = all cores)')
+    argParser.add_argument('--force', action='store_true', default=False, help='Run every selected stage even if it is up to date')
+    argParser.add_argument('--dry_run', action='store_true', default=False, help='Only print the stages that would run')
+    args = argParser.parse_args()
+
+    with open(args.config, 'r') as f:
+        config = json.load(f)
+    stages = load_stages(config)
+    if args.stages:
+        stages = select_stages(stages, args.stages)
+    n_jobs = args.jobs if args.jobs > 0 else os.cpu_count()
+
+    start_time = time.time()
+    pipeline = Pipeline(stages, config.get("cache_dir", CACHE_DIR))
+    report = pipeline.run(n_jobs, args.force, args.dry_run)
+    wall_time = time.time() - start_time
+
+    print(f"\n{'Stage':<45}{'Status':<12}{'Time (s)':>10}")
+    for name in pipeline.order:
+        status, elapsed = report[name]
+        print(f"{name:<45}{status:<12}{elapsed:>10.1f}")
+    print(f"Wall time {wall_time:.1f} s, summed stage time {sum(elapsed for _, elapsed in report.values()):.1f} s")
+    if any(status in ("failed", "blocked") for status, _ in report.values()):
+        raise SystemExit(1)
@@ -1,6 +1,7 @@
 import os
 import re
-import ROOT
+from results_io import read_results
+from results_catalog import find_root_files
 #import mplhep as hep
 
 LOW_TEMP = False
@@ -22,23 +23,9 @@ def extract_dose(input_string):
     else:
         return None  # In case there's no match
 
-# Finding ROOT files in directories
-def find_root_files_in_directories():
-    root_files = []
-    current_dir = os.getcwd()
-
-    for dirpath, dirnames, filenames in os.walk(current_dir):
-        if dirpath != current_dir:
-            for file in filenames:
-                if file.endswith(".root"):
-                    full_path = os.path.join(dirpath, file)
-                    root_files.append(full_path)
-
-    return root_files
-
 # Main part of the script
 if __name__ == "__main__":
-    root_files = find_root_files_in_directories()
+    root_files = find_root_files(kind='qinj')
 
     # Initialize a dictionary to store data by file
     file_data = {}
@@ -67,25 +54,14 @@ if __name__ == "__main__":
             "current": []
         }
 
-        file = ROOT.TFile(file_name)
-        tree = file.Get("qinj_results")
+        # Read all the branches of the tree as NumPy arrays in one call
+        columns = read_results(file_name)
 
-        if not tree:
+        if columns is None:
             print(f"Tree 'qinj_results' not found in {file_name}")
             continue 
 
-        for entry in tree:
-            # Append data to the lists within the dictionary for this file
-            file_data[file_name]["charge"].append(entry.charge)
-            file_data[file_name]["width"].append(entry.width)
-            file_data[file_name]["HM_left"].append(entry.HM_left)
-            file_data[file_name]["sigma_left"].append(entry.sigma_left)
-            file_data[file_name]["sigma_right"].append(entry.sigma_right)
-            file_data[file_name]["timestamp"].append(entry.timestamp)
-            file_data[file_name]["voltage"].append(entry.voltage)
-            file_data[file_name]["current"].append(entry.current)
-
-        file.Close()   
+        file_data[file_name].update(columns)
 
     import matplotlib.pyplot as plt
     plt.figure()
@@ -1,14 +1,19 @@
 import os
 import re
-import ROOT
 import argparse
 import numpy as np
-import matplotlib.pyplot as plt
-from scipy.optimize import curve_fit
+from itertools import product
+from concurrent.futures import ProcessPoolExecutor
+from results_io import read_results
+from results_catalog import find_root_files
+# matplotlib.pyplot and scipy.optimize are imported when the first plot is drawn
+from lazy import plt, optimize
 #import mplhep as hep
 
 LOW_TEMP = True
 ALL = False
+# Plots drawn by --all_plots: (low_temp, xvar, yvar, group_plot), the 16 combinations of the thesis
+PLOT_MATRIX = list(product((False, True), ('current', 'charge'), ('width', 'HM_left'), (False, True)))
 
 # Dose extraction from filename
 def extract_dose(input_string, verbose : bool = False):
@@ -28,44 +33,22 @@ def extract_dose(input_string, verbose : bool = False):
     else:
         return None  # In case there's no match
 
-# Finding ROOT files in directories
-def find_root_files_in_directories():
-    root_files = []
-    current_dir = os.getcwd()
-
-    for dirpath, dirnames, filenames in os.walk(current_dir):
-        if dirpath != current_dir:
-            for file in filenames:
-                if file.endswith(".root"):
-                    full_path = os.path.join(dirpath, file)
-                    root_files.append(full_path)
-
-    return root_files
-
 def linear(x, m, q):
     return x * m + q
 
-# Main part of the script
-if __name__ == "__main__":
-    argParser = argparse.ArgumentParser(description='Argument parser')
-    argParser.add_argument('--xvar',action='store',default=None,type=str,help='Define x variable to plot')
-    argParser.add_argument('--yvar',action='store',default=None,type=str,help='Define y variable to plot')
-    argParser.add_argument('--low_temp', action='store',default=None,type=int,help='Select RoomT or Cold measurements')
-    argParser.add_argument('--group_plot',action='store_true',default=False,help='Plot average and std values instead of scatter')
-    args = argParser.parse_args()
-    root_files = find_root_files_in_directories()
-    if args.low_temp is not None:
-        LOW_TEMP = bool(args.low_temp)
+# Reads the results of every FBK file of the catalog, once for all the plots
+# reader replaces read_results, e.g. by a cached version in analysis_server.py
+def load_file_data(reader = read_results):
+    root_files = find_root_files(kind='qinj')
     # Initialize a dictionary to store data by file
     file_data = {}
 
-    colors = ('blue','red','green','orange')
     if not root_files:
         print("No ROOT files found in the subdirectories.")
     else:
         print(f"Found {len(root_files)} ROOT files.")
 
-    for i, file_name in enumerate(root_files):
+    for file_name in root_files:
         #print(f"Processing file: {file_name}")
         if 'HPK' in file_name:
             continue
@@ -84,36 +67,20 @@ if __name__ == "__main__":
             "current": []
         }
 
-        file = ROOT.TFile(file_name)
-        tree = file.Get("qinj_results")
+        # Read all the branches of the tree as NumPy arrays in one call
+        columns = reader(file_name)
 
-        if not tree:
+        if columns is None:
             print(f"Tree 'qinj_results' not found in {file_name}")
             continue 
 
-        for entry in tree:
-            # Append data to the lists within the dictionary for this file
-            file_data[file_name]["charge"].append(entry.charge)
-            file_data[file_name]["width"].append(entry.width)
-            file_data[file_name]["HM_left"].append(entry.HM_left)
-            file_data[file_name]["sigma_left"].append(entry.sigma_left)
-            file_data[file_name]["sigma_right"].append(entry.sigma_right)
-            file_data[file_name]["timestamp"].append(entry.timestamp)
-            file_data[file_name]["voltage"].append(entry.voltage)
-            file_data[file_name]["current"].append(entry.current)
+        file_data[file_name].update(columns)
 
-        file.Close()   
-
-    plt.figure(figsize=(11,8))
-    
-    y_plot = "HM_left" #"width" #"HM_left"
-    if args.yvar in ['width','HM_left']:
-        y_plot = args.yvar
-    x_plot = "current"  #"current" #"charge"
-    if args.xvar in ['current','charge']:
-        x_plot = args.xvar
+    return file_data
 
-    
+# Draws and saves one plot from the data already in memory
+def draw_plot(file_data: dict, low_temp: bool, x_plot: str, y_plot: str, group_plot: bool):
+    colors = ('blue','red','green','orange')
     Title_x_axis = ""
     if x_plot == "current":
         Title_x_axis = "Current (uA)"
@@ -129,6 +96,8 @@ if __name__ == "__main__":
         Title_y_axis = "Current (uA)"
     
     if ALL:
+        plt.figure(figsize=(11,8))
+        i = 0
         filtered_data = file_data
         for file_name, data in filtered_data.items():
             i += 1
@@ -144,7 +113,7 @@ if __name__ == "__main__":
         #plt.show()
         plt.close()
     else:
-        if LOW_TEMP:
+        if low_temp:
             filtered_data = {fname: data for fname, data in file_data.items() if data["temperature"] < 0}
 
             plt.figure(figsize=(11,8))
@@ -153,7 +122,7 @@ if __name__ == "__main__":
             for file_name, data in filtered_data.items():
                 if  '_0E14' in file_name: #y_plot == 'width' and
                     continue
-                if not args.group_plot:
+                if not group_plot:
                     plt.scatter(data[x_plot], data[y_plot], color=colors[i], label=fr"{extract_dose(file_name, True)}e14 $n_{{eq}}/cm^2$")
                 else:
                     x_unique = np.unique(data[x_plot])
@@ -175,7 +144,7 @@ if __name__ == "__main__":
                     ydata = np.array(data[y_plot] - yshift)
                     plt.errorbar(x_unique, y_mean, y_std, fmt='o', color=colors[i], label=f"{extract_dose(file_name, True)}e14 $n_{{eq}}/cm^2$")
                     p0 = [1,0]
-                    popt, pcov = curve_fit(linear,data[x_plot],ydata,p0)
+                    popt, pcov = optimize.curve_fit(linear,data[x_plot],ydata,p0)
                     mfit = popt[0]
                     merr = np.sqrt(np.diag(pcov)[0])
                     x_curve = np.linspace(np.min(data[x_plot])-1,np.max(data[x_plot])+1,500)
@@ -189,7 +158,7 @@ if __name__ == "__main__":
             if y_plot == "width":
                 plt.title(f"Width for irradiated sensors data \n Acquired at -20C")
             plt.legend([handles[i] for i in order], [labels[i] for i in order], title="Dose",fontsize='x-large',loc='best')
-            plt.savefig(f'{os.getcwd()}/Plots_thesis/PostIrradiation/{y_plot}_{x_plot}_irr{'_grouped' if args.group_plot else ''}.png')
+            plt.savefig(f'{os.getcwd()}/Plots_thesis/PostIrradiation/{y_plot}_{x_plot}_irr{"_grouped" if group_plot else ""}.png')
             #plt.show()
             plt.close()
         else:
@@ -197,7 +166,7 @@ if __name__ == "__main__":
             plt.figure(figsize=(11,8))
             i = 0
             for file_name, data in filtered_data.items():
-                if not args.group_plot:
+                if not group_plot:
                     plt.scatter(data[x_plot], data[y_plot], color=colors[i], label="light on" if "lighton" in file_name else "light off")
                 else:
                     x_unique = np.unique(data[x_plot])
@@ -216,7 +185,7 @@ if __name__ == "__main__":
                             y_std.append(np.nan)
                     plt.errorbar(x_unique, y_mean, y_std, fmt='o', color=colors[i], label="light on" if "lighton" in file_name else "light off")
                     p0 = [1,0]
-                    popt, pcov = curve_fit(linear,data[x_plot],data[y_plot],p0)
+                    popt, pcov = optimize.curve_fit(linear,data[x_plot],data[y_plot],p0)
                     x_curve = np.linspace(np.min(data[x_plot])-1,np.max(data[x_plot])+1,500)
                     plt.plot(x_curve,linear(x_curve,popt[0],popt[1]),color = colors[i], linestyle = '--', label = "Fit light on" if "lighton" in file_name else "Fit light off")
                 i += 1
@@ -231,8 +200,50 @@ if __name__ == "__main__":
             if y_plot == "width":
                 plt.title(f"Width for unirradiated sensors data \n Acquired at +22C",fontsize='x-large')
             plt.legend(title="Light status",fontsize='x-large',loc='best')
-            plt.savefig(f'{os.getcwd()}/Plots_thesis/Unirradiated/{y_plot}_{x_plot}_unirr{'_grouped' if args.group_plot else ''}.png')
+            plt.savefig(f'{os.getcwd()}/Plots_thesis/Unirradiated/{y_plot}_{x_plot}_unirr{"_grouped" if group_plot else ""}.png')
             #plt.show()
             plt.close()
 
-    
\ No newline at end of file
+# Every worker of the pool receives the data once and draws with the non-interactive backend
+def init_worker(file_data: dict):
+    global worker_data
+    plt.switch_backend('Agg')
+    worker_data = file_data
+
+def draw_worker(plot: tuple):
+    draw_plot(worker_data, *plot)
+    return plot
+
+# Main part of the script
+if __name__ == "__main__":
+    argParser = argparse.ArgumentParser(description='Argument parser')
+    argParser.add_argument('--xvar',action='store',default=None,type=str,help='Define x variable to plot')
+    argParser.add_argument('--yvar',action='store',default=None,type=str,help='Define y variable to plot')
+    argParser.add_argument('--low_temp', action='store',default=None,type=int,help='Select RoomT or Cold measurements')
+    argParser.add_argument('--group_plot',action='store_true',default=False,help='Plot average and std values instead of scatter')
+    argParser.add_argument('--all_plots',action='store_true',default=False,help='Draw every (low_temp, xvar, yvar, group_plot) combination from a single read of the data')
+    argParser.add_argument('--workers',action='store',default=1,type=int,help='Number of processes drawing the plots of --all_plots (0 = all cores)')
+    args = argParser.parse_args()
+    if args.low_temp is not None:
+        LOW_TEMP = bool(args.low_temp)
+    file_data = load_file_data()
+
+    if args.all_plots:
+        n_workers = args.workers if args.workers > 0 else os.cpu_count()
+        if n_workers > 1:
+            with ProcessPoolExecutor(max_workers=n_workers, initializer=init_worker, initargs=(file_data,)) as executor:
+                for plot in executor.map(draw_worker, PLOT_MATRIX):
+                    print(f"Saved plot low_temp={plot[0]} xvar={plot[1]} yvar={plot[2]} group_plot={plot[3]}")
+        else:
+            plt.switch_backend('Agg')
+            for plot in PLOT_MATRIX:
+                draw_plot(file_data, *plot)
+                print(f"Saved plot low_temp={plot[0]} xvar={plot[1]} yvar={plot[2]} group_plot={plot[3]}")
+    else:
+        y_plot = "HM_left" #"width" #"HM_left"
+        if args.yvar in ['width','HM_left']:
+            y_plot = args.yvar
+        x_plot = "current"  #"current" #"charge"
+        if args.xvar in ['current','charge']:
+            x_plot = args.xvar
+        draw_plot(file_data, LOW_TEMP, x_plot, y_plot, args.group_plot)
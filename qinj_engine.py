@@ -0,0 +1,435 @@
+import json
+import os
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from re import search
+from time import mktime
+from datetime import datetime
+from scurve_fit import fit_edges_warm, find_windows, stack_curves, converged_params, warm_start
+from scan_cache import load_scan, CACHE_DIR
+from run_index import RunIndex
+from fit_cache import FitCache
+from results_io import QINJ_DTYPES, write_results, write_sidecar
+from fit_models import get_model
+# PyROOT is imported only by the code paths that draw or fit with it, the matrix mode runs without it
+from lazy import ROOT
+
+def parse_file(filename: str):
+    with open(filename, 'r') as f:
+        data = json.load(f)
+    return data
+
+# Reads vth and hits of a Qinj scan, through the binary cache when a cache directory is given
+def read_curve(filename: str, cache_dir: str = None):
+    if cache_dir:
+        scan = load_scan(filename, cache_dir)
+        return np.array(scan['vth']), np.array(scan['hits'])
+    data = parse_file(filename)
+    return np.array(data['vth'], dtype='float64'), np.array(data['hits'], dtype='float64')  # Convert to numpy array of type float64
+
+# Returns the charges and the Qinj_scan json files of a timestamp, sorted by charge
+def list_charge_files(filepath: str):
+    json_files = [file for file in os.listdir(filepath) if file.endswith('.json')]
+    charges = [float(file.split('_')[-1].split('.')[0]) for file in json_files]
+    charges, json_files = zip(*sorted(zip(charges, json_files), key=lambda x: x[0]))
+    return list(charges), list(json_files)
+
+# Finds the Qinj_scan json files of every pixel under a timestamp directory, sorted by row, column and charge
+# The pixel is read from the "row-col" tag of the path inside the timestamp directory, files without it belong to default_pixel
+def list_pixel_files(filepath: str, default_pixel: str = None):
+    default_match = search(r'(\d+)-(\d+)', default_pixel) if default_pixel else None
+    default_row_col = (int(default_match.group(1)), int(default_match.group(2))) if default_match else (-1, -1)
+    entries = []
+    for dirpath, dirnames, filenames in os.walk(filepath):
+        for file in filenames:
+            if not file.endswith('.json'):
+                continue
+            full_path = os.path.join(dirpath, file)
+            pixel_match = search(r'(\d+)-(\d+)', os.path.relpath(full_path, filepath))
+            row, col = (int(pixel_match.group(1)), int(pixel_match.group(2))) if pixel_match else default_row_col
+            entries.append((row, col, float(file.split('_')[-1].split('.')[0]), full_path))
+    entries.sort(key=lambda x: x[:3])
+    rows, cols, charges, files = zip(*entries)
+    return list(rows), list(cols), list(charges), list(files)
+
+# Picks a fit limit: scalars apply to every curve, flat lists are indexed by the innermost index
+# and nested lists by the outer indices first (e.g. [timestamp][charge])
+def pick_limit(value, *indices):
+    if not isinstance(value, list):
+        return float(value)
+    if isinstance(value[0], list):
+        return pick_limit(value[indices[0]], *indices[1:])
+    return float(value[indices[-1]])
+
+# Resolves the left and right fit windows of charge i at timestamp j
+def fit_windows(windows: dict, j: int, i: int, charge: float, voltage: int):
+    low_left = pick_limit(windows["lowLim_left"], j)
+    high_left = pick_limit(windows["highLim_left"], j)
+    # Initial position of the left edge, used by the erf model
+    seed_left = (low_left + high_left) / 2.
+    high_left += charge * windows.get("left_charge_slope", 0.)
+    low_right = pick_limit(windows["lowLim_right"], j, i)
+    high_right = pick_limit(windows["highLim_right"], j, i)
+    # Initial position of the right edge; as the left one, it is not moved by the overrides, which only change the fit ranges
+    seed_right = (low_right + high_right) / 2.
+
+    # Hand-tuned exceptions for single bias points or charges, the last matching one wins
+    for override in windows.get("overrides", []):
+        if override.get("voltage", voltage) != voltage or override.get("charge", charge) != charge:
+            continue
+        if "lowLim_left" in override:
+            low_left = pick_limit(override["lowLim_left"], i)
+            high_left = pick_limit(override["highLim_left"], i)
+        if "lowLim_right" in override:
+            low_right = pick_limit(override["lowLim_right"], i)
+            high_right = pick_limit(override["highLim_right"], i)
+
+    return low_left, high_left, low_right, high_right, seed_left, seed_right
+
+# Returns the (low_left, high_left, low_right, high_right, seed_left, seed_right) limits of every curve,
+# found from the data when the windows are set to "auto" and from the hand-tuned tables otherwise
+def curve_limits(windows: dict, j: int, charge_indices: list, charges: list, bias: int, vths: list, hitss: list):
+    if windows.get("auto", False):
+        vth, hits = stack_curves(vths, hitss)
+        found = find_windows(vth, hits, **windows.get("auto_options", {}))
+        seed_left = (found["low_left"] + found["high_left"]) / 2.
+        seed_right = (found["low_right"] + found["high_right"]) / 2.
+        return np.stack([found["low_left"], found["high_left"], found["low_right"], found["high_right"], seed_left, seed_right], axis=1)
+    return np.array([fit_windows(windows, j, i, charge, bias) for i, charge in zip(charge_indices, charges)])
+
+# Converged parameters of a fitted TF1 as a (1, npar) array, NaN if the fit did not end on a usable edge
+def converged_tf1(model: str, function, low: float, high: float):
+    params = np.array([[function.GetParameter(k) for k in range(function.GetNpar())]])
+    return params if converged_params(model, params, low, high)[0] else np.full_like(params, np.nan)
+
+# Fits the edges of every curve with ROOT, one TGraph.Fit per edge
+# With seed_from, curve i starts from the converged parameters of curve seed_from[i] (-1: default starting values).
+# A seeded gaus left edge is fitted with the "B" option, otherwise ROOT replaces the seed with its own gaus initialization
+def fit_edges_root(graphs: list, limits: np.array, left_model: str, fit_options: str, timestamp: str, seed_from: list = None):
+    edges = {"HM_left": [], "width": [], "sigma_left": [], "sigma_right": []}
+    seeds = []
+    for i, graph_hits in enumerate(graphs):
+        low_left, high_left, low_right, high_right, seed_left, seed_right = limits[i]
+        seed = seed_from[i] if seed_from is not None else -1
+        # Models of the left ("gaus" or "erf") and right ("erfc") edges from the shared pool, compiled once
+        fit_functions_left = get_model(left_model, low_left, high_left, f"fit_left_{timestamp}_{i}", slot="left")
+        fit_functions_left.SetLineColor(i + 1)
+        # The gaus model without seed keeps the starting values ROOT computes from the data
+        p0_left = np.array([[seed_left, 20., 8., 4.]]) if left_model == "erf" else np.full((1, 3), np.nan)
+        if seed >= 0:
+            p0_left, _ = warm_start(left_model, p0_left, seeds[seed][0])
+        left_options = fit_options
+        if np.isfinite(p0_left).all():
+            fit_functions_left.SetParameters(*p0_left[0])
+            if left_model == "gaus" and "B" not in left_options:
+                left_options += "B"
+
+        fit_functions_right = get_model("erfc", low_right, high_right, f"fit_right_{timestamp}_{i}", slot="right")
+        fit_functions_right.SetLineColor(i + 1)
+        p0_right = np.array([[seed_right, 20., 8., 4.]])
+        if seed >= 0:
+            p0_right, _ = warm_start("erfc", p0_right, seeds[seed][1])
+        fit_functions_right.SetParameters(*p0_right[0])
+
+        # Perform the fits
+        graph_hits.Fit(fit_functions_left, left_options)
+        graph_hits.Fit(fit_functions_right, fit_options)
+        seeds.append((converged_tf1(left_model, fit_functions_left, low_left, high_left),
+                      converged_tf1("erfc", fit_functions_right, low_right, high_right)))
+
+        # Compute relevant variables
+        if left_model == "erf":
+            x_left = fit_functions_left.GetParameter(0)
+            sigma_left = fit_functions_left.GetParameter(1)
+        else:
+            x_left = fit_functions_left.GetParameter(1) - fit_functions_left.GetParameter(2) * ROOT.TMath.Sqrt(2 * ROOT.TMath.Log(2))
+            sigma_left = fit_functions_left.GetParameter(2)
+        x_right = fit_functions_right.GetParameter(0)
+        edges["HM_left"].append(x_left)
+        edges["width"].append(abs(x_left - x_right))
+        edges["sigma_left"].append(sigma_left)
+        edges["sigma_right"].append(fit_functions_right.GetParameter(1))
+    return edges
+
+# Fits the edges of all the curves with the NumPy batch fitter, warm started from the curves in seed_from if given
+def fit_edges_numpy(vths: list, hitss: list, limits: np.array, left_model: str, seed_from: list = None):
+    vth, hits = stack_curves(vths, hitss)
+    return fit_edges_warm(vth, hits, limits[:, 0], limits[:, 1], limits[:, 2], limits[:, 3], left_model, seed_from)
+
+# Curve each fit is seeded from: the previous charge of the same pixel, -1 for the first charge of every pixel
+# pixels lists the pixel of every curve, curves being sorted by pixel and charge
+def previous_charge_seeds(pixels: list):
+    return [i - 1 if i > 0 and pixels[i - 1] == pixel else -1 for i, pixel in enumerate(pixels)]
+
+# Fits all the charges of one timestamp and returns one row per charge
+def process_timestamp(series: dict, j: int, timestamp: str, dir_path: str, run_info: tuple, fitter: str = "root"):
+    module_id = series["module_id"]
+    windows = series.get("windows", {"auto": True})
+    left_model = windows.get("left_model", "gaus")
+    fit_options = series.get("fit_options", "QR+")
+    currents = series.get("currents", [])
+    outdir = series["outdir"]
+
+    mg = ROOT.TMultiGraph()
+    legend = ROOT.TLegend(0.75, 0.75, 0.9, 0.9)
+    canvas = ROOT.TCanvas("canvas", "S curve for Qinj", 800, 600)
+
+    filepath = dir_path + str(module_id) + "/" + timestamp + "/"
+    voltage, temperature, pixel, fluence = run_info
+    bias = int(voltage.replace("V", ""))
+    timecode = float(mktime(datetime.strptime(timestamp, "%Y-%m-%d-%H-%M-%S").timetuple()))
+    charges, json_files = list_charge_files(filepath)
+
+    vths, hitss, graphs = [], [], []
+    for i, file in enumerate(json_files):
+        vth, hits = read_curve(filepath + file, series.get("cache_dir"))
+        vths.append(vth)
+        hitss.append(hits)
+
+        # Create TGraph with vth and hits data
+        graph_hits = ROOT.TGraph(len(vths[i]), vths[i], hitss[i])
+        graph_hits.SetMarkerStyle(20)
+        graph_hits.SetMarkerColor(i + 1)
+        graph_hits.SetLineColor(i + 1)
+        graphs.append(graph_hits)
+    limits = curve_limits(windows, j, list(range(len(charges))), charges, bias, vths, hitss)
+
+    # Each charge starts from the converged fit of the previous one, when warm start is on
+    seed_from = previous_charge_seeds([pixel] * len(charges)) if series.get("warm_start", True) else None
+    if fitter == "numpy":
+        edges = fit_edges_numpy(vths, hitss, limits, left_model, seed_from)
+    else:
+        edges = fit_edges_root(graphs, limits, left_model, fit_options, timestamp, seed_from)
+
+    rows = []
+    for i, graph_hits in enumerate(graphs):
+        rows.append({
+            "charge": charges[i],
+            "width": float(edges["width"][i]),
+            "HM_left": float(edges["HM_left"][i]),
+            "sigma_left": float(edges["sigma_left"][i]),
+            "sigma_right": float(edges["sigma_right"][i]),
+            "timestamp": timecode,
+            "voltage": bias,
+            "current": currents[j] if j < len(currents) else 0.
+        })
+
+        # Add graph to the multigraph
+        mg.Add(graph_hits)
+        legend.AddEntry(graph_hits, f'{charges[i]} fC', 'lp')
+
+    # Draw the multigraph and the legend
+    mg.Draw("AP")
+    mg.SetTitle(f"S curve for Qinj - {voltage}; Vth; Hit rate")
+    legend.Draw()
+    canvas.Update()
+    canvas.Draw()
+    canvas.SaveAs(f"{outdir}Qinj_vs_Vth_{voltage}.png")
+
+    return rows
+
+# Fits every pixel and charge of one timestamp as a single batch and returns per-curve columns
+def process_timestamp_matrix(series: dict, j: int, timestamp: str, dir_path: str, run_info: tuple):
+    module_id = series["module_id"]
+    windows = series.get("windows", {"auto": True})
+    left_model = windows.get("left_model", "gaus")
+    currents = series.get("currents", [])
+
+    filepath = dir_path + str(module_id) + "/" + timestamp + "/"
+    voltage, temperature, pixel, fluence = run_info
+    bias = int(voltage.replace("V", ""))
+    timecode = float(mktime(datetime.strptime(timestamp, "%Y-%m-%d-%H-%M-%S").timetuple()))
+    pix_rows, pix_cols, charges, files = list_pixel_files(filepath, series.get("pixel", pixel))
+
+    vths, hitss = [], []
+    for file in files:
+        vth, hits = read_curve(file, series.get("cache_dir"))
+        vths.append(vth)
+        hitss.append(hits)
+    # Fit windows depend on the position of the charge in the scan, as in the single pixel mode
+    charge_index = {charge: i for i, charge in enumerate(sorted(set(charges)))}
+    limits = curve_limits(windows, j, [charge_index[charge] for charge in charges], charges, bias, vths, hitss)
+    seed_from = previous_charge_seeds(list(zip(pix_rows, pix_cols))) if series.get("warm_start", True) else None
+    edges = fit_edges_numpy(vths, hitss, limits, left_model, seed_from)
+
+    n_curves = len(files)
+    return {
+        "row": np.array(pix_rows, dtype=np.int32),
+        "col": np.array(pix_cols, dtype=np.int32),
+        "charge": np.array(charges, dtype=np.int32),
+        "width": edges["width"],
+        "HM_left": edges["HM_left"],
+        "sigma_left": edges["sigma_left"],
+        "sigma_right": edges["sigma_right"],
+        "chi2_left": edges["chi2_left"],
+        "chi2_right": edges["chi2_right"],
+        "ndf_left": edges["ndf_left"],
+        "ndf_right": edges["ndf_right"],
+        "timestamp": np.full(n_curves, timecode),
+        "voltage": np.full(n_curves, bias, dtype=np.int32),
+        "current": np.full(n_curves, currents[j] if j < len(currents) else 0.)
+    }
+
+# Merges the per-pixel columns of the timestamps of a matrix scan
+def merge_matrix_results(results: list):
+    return {key: np.concatenate([result[key] for result in results]) for key in results[0]}
+
+# Turns the rows of a series into one array per branch of the qinj_results tree
+def rows_to_columns(rows: list):
+    return {name: np.array([row[name] for row in rows], dtype=dtype) for name, dtype in QINJ_DTYPES.items()}
+
+# Prepares the output of a series and returns its file name with one job per timestamp
+def prepare_series(series: dict, dir_path: str, results_path: str, run_index: RunIndex, fitter: str = "root", matrix: bool = False):
+    module_id = series["module_id"]
+    timestamps = series["timestamps"]
+    outdir = series["outdir"]
+    os.makedirs(outdir, exist_ok=True)
+
+    runs = run_index.runs(results_path + str(module_id) + "/")
+    run_infos = [runs.get(timestamp, (None, None, None, None)) for timestamp in timestamps]
+
+    # Assumes the user is smart enought to provide timestamps of the same series
+    voltage, temperature, pixel, fluence = run_infos[0]
+    pixel = series.get("pixel", pixel)
+    if temperature is None:
+        temperature = "roomT"
+
+    if matrix:
+        outfilename = f"{outdir}matrix_results_mod{str(module_id)}_{series['dose']}_{temperature}{series.get('outfile_suffix', '')}.npz"
+        jobs = [(process_timestamp_matrix, (series, j, timestamp, dir_path, run_infos[j])) for j, timestamp in enumerate(timestamps)]
+    else:
+        outfilename = f"{outdir}results_mod{str(module_id)}_{pixel}_{series['dose']}_{temperature}{series.get('outfile_suffix', '')}.root"
+        jobs = [(process_timestamp, (series, j, timestamp, dir_path, run_infos[j], fitter)) for j, timestamp in enumerate(timestamps)]
+    return outfilename, jobs
+
+# Input directory, fit settings and plot file of a timestamp job, used to key its cached result
+def job_signature(job: tuple):
+    process, args = job
+    series, j, timestamp, dir_path, run_info = args[:5]
+    currents = series.get("currents", [])
+    filepath = dir_path + str(series["module_id"]) + "/" + timestamp + "/"
+    settings = {
+        "process": process.__name__,
+        "fitter": args[5] if len(args) > 5 else None,
+        "timestamp": timestamp,
+        "j": j,
+        "run_info": run_info,
+        "windows": series.get("windows", {"auto": True}),
+        "fit_options": series.get("fit_options", "QR+"),
+        "current": currents[j] if j < len(currents) else 0.,
+        "pixel": series.get("pixel"),
+        "warm_start": series.get("warm_start", True)
+    }
+    png = f"{series['outdir']}Qinj_vs_Vth_{run_info[0]}.png" if process is process_timestamp else None
+    return filepath, settings, png
+
+def run_job(job: tuple):
+    process, args = job
+    return process(*args)
+
+# Sets up ROOT in every worker process that uses it
+def init_worker(batch: bool, use_root: bool = True):
+    if use_root:
+        ROOT.gROOT.SetBatch(batch)
+        ROOT.gErrorIgnoreLevel = 3000
+
+# Runs the timestamp jobs, in parallel if n_jobs > 1, and returns their rows in submission order
+def run_jobs(jobs: list, n_jobs: int = 1, batch: bool = True, use_root: bool = True):
+    if n_jobs <= 1:
+        return [run_job(job) for job in jobs]
+    with ProcessPoolExecutor(max_workers=n_jobs, initializer=init_worker, initargs=(batch, use_root)) as executor:
+        return list(executor.map(run_job, jobs))
+
+# Processes all the timestamps of the given series and saves each series in its own ROOT file
+# With a fit cache only the timestamps whose inputs or settings changed are fitted, the others are taken from the cache
+# With sidecar ("parquet" or "hdf5") the columns are also saved in that format next to each output file
+def process_series(series_list: list, dir_path: str, results_path: str, n_jobs: int = 1, batch: bool = True, fitter: str = "root", matrix: bool = False, index_dir: str = CACHE_DIR, fit_cache: FitCache = None, sidecar: str = None):
+    # The run directories of every module are parsed once and the index is kept on disk for the next runs
+    run_index = RunIndex(index_dir)
+    prepared = [prepare_series(series, dir_path, results_path, run_index, fitter, matrix) for series in series_list]
+    run_index.save()
+    all_jobs = [job for _, jobs in prepared for job in jobs]
+
+    results = [None] * len(all_jobs)
+    if fit_cache is not None:
+        signatures = [job_signature(job) for job in all_jobs]
+        keys = [fit_cache.key(filepath, settings) for filepath, settings, _ in signatures]
+        results = [fit_cache.load(key) for key in keys]
+    pending = [k for k, result in enumerate(results) if result is None]
+    print(f"Fitting {len(pending)} of {len(all_jobs)} timestamps from {len(prepared)} series with {n_jobs} process(es)")
+    for k, result in zip(pending, run_jobs([all_jobs[k] for k in pending], n_jobs, batch, not matrix)):
+        results[k] = result
+        if fit_cache is not None:
+            fit_cache.store(keys[k], result, signatures[k][2])
+    if fit_cache is not None:
+        # Plots are restored in timestamp order, so a plot shared by several timestamps ends up as in a full run
+        for key, (_, _, png) in zip(keys, signatures):
+            if png is not None:
+                fit_cache.restore_plot(key, png)
+        fit_cache.save()
+
+    # Merge back the rows of each series following the order of its timestamps
+    outfilenames = []
+    first = 0
+    for outfilename, jobs in prepared:
+        series_results = results[first:first + len(jobs)]
+        first += len(jobs)
+        if matrix:
+            columns = merge_matrix_results(series_results)
+            np.savez(outfilename, **columns)
+        else:
+            columns = rows_to_columns([row for timestamp_rows in series_results for row in timestamp_rows])
+            write_results(outfilename, columns)
+        print(f"Data saved to {outfilename}")
+        if sidecar:
+            print(f"Columns saved to {write_sidecar(outfilename, columns, sidecar)}")
+        outfilenames.append(outfilename)
+    return outfilenames
+
+def load_config(filename: str):
+    with open(filename, 'r') as f:
+        config = json.load(f)
+    return config
+
+# Main part of the script
+if __name__ == "__main__":
+    argParser = argparse.ArgumentParser(description='Extract S curve parameters for the run series listed in a config file')
+    argParser.add_argument('--config', action='store', default='qinj_series.json', type=str, help='JSON file describing the run series')
+    argParser.add_argument('--series', action='store', nargs='+', default=None, type=str, help='Process only the series with these names')
+    argParser.add_argument('--display', action='store_true', default=False, help='Display the canvases instead of running in batch mode')
+    argParser.add_argument('--jobs', action='store', default=1, type=int, help='Number of worker processes fitting timestamps in parallel (0 = all cores)')
+    argParser.add_argument('--fitter', action='store', default='root', choices=['root', 'numpy'], help='Fit the S curve edges with ROOT TF1 or with the NumPy batch fitter')
+    argParser.add_argument('--matrix', action='store_true', default=False, help='Fit every pixel found under each timestamp as one batch and save per-pixel columns')
+    argParser.add_argument('--auto_windows', action='store_true', default=False, help='Find the fit windows from the data instead of the hand-tuned limits')
+    argParser.add_argument('--no_warm_start', action='store_true', default=False, help='Start every edge fit from the default values instead of the fit of the previous charge')
+    argParser.add_argument('--refit', action='store_true', default=False, help='Fit every timestamp again instead of reusing the results of unchanged timestamps')
+    argParser.add_argument('--sidecar', action='store', default=None, choices=['parquet', 'hdf5'], help='Also save the results as a Parquet or HDF5 file for readers without ROOT')
+    argParser.add_argument('--cache_dir', action='store', default=None, type=str, help='Read the scans through the binary cache in this directory (see scan_cache.py)')
+    args = argParser.parse_args()
+
+    if not args.matrix:
+        ROOT.gROOT.SetBatch(not args.display)
+        ROOT.gErrorIgnoreLevel = 3000  #sets the ignore level to "Warning" instead of "Info" (error=3000, warning=2000, info=1000, print=0)
+
+    n_jobs = args.jobs if args.jobs > 0 else os.cpu_count()
+    if args.display:
+        # Canvases can only be displayed from the main process
+        n_jobs = 1
+
+    config = load_config(args.config)
+    dir_path = config.get("dir_path", "./module_test/outputs/")
+    results_path = config.get("results_path", "./module_test/results/")
+    series_list = [series for series in config["series"] if not args.series or series["name"] in args.series]
+    cache_dir = args.cache_dir or config.get("cache_dir")
+    if cache_dir:
+        series_list = [dict(series, cache_dir=cache_dir) for series in series_list]
+    if args.auto_windows:
+        series_list = [dict(series, windows=dict(series.get("windows", {}), auto=True)) for series in series_list]
+    if args.no_warm_start:
+        series_list = [dict(series, warm_start=False) for series in series_list]
+    fit_cache = None if args.refit else FitCache(cache_dir or CACHE_DIR)
+    process_series(series_list, dir_path, results_path, n_jobs, not args.display, args.fitter, args.matrix, cache_dir or CACHE_DIR, fit_cache, args.sidecar or config.get("sidecar"))
+
+    if args.display:
+        input('press ENTER to quit')
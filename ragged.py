@@ -0,0 +1,111 @@
+import numpy as np
+
+# Ragged per-Vth hit lists (ToA or ToT): one flat values array plus an offsets array,
+# the hits recorded at vth[i] being values[offsets[i]:offsets[i+1]].
+class Ragged:
+    def __init__(self, values: np.array, offsets: np.array, vth: np.array):
+        self.values = np.asarray(values)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.vth = np.asarray(vth)
+        if len(self.offsets) != len(self.vth) + 1 or self.offsets[-1] != len(self.values):
+            raise ValueError(f"Inconsistent ragged layout: {len(self.vth)} Vth steps, {len(self.offsets)} offsets, {len(self.values)} values")
+
+    # Builds the container from nested lists, as stored in the Qinj_scan json files
+    @classmethod
+    def from_nested(cls, nested: list, vth: np.array):
+        lengths = np.fromiter((len(sublist) for sublist in nested), dtype=np.int64, count=len(nested))
+        offsets = np.zeros(len(nested) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        values = np.concatenate([np.asarray(sublist, dtype=np.float64) for sublist in nested]) if offsets[-1] else np.zeros(0)
+        return cls(values, offsets, vth)
+
+    # Builds the container from a scan loaded with scan_cache.load_scan, key being 'toa' or 'tot'
+    @classmethod
+    def from_scan(cls, scan: dict, key: str):
+        return cls(scan[f"{key}_values"], scan[f"{key}_offsets"], scan["vth"])
+
+    def __len__(self):
+        return len(self.vth)
+
+    def __getitem__(self, i: int):
+        return self.values[self.offsets[i]:self.offsets[i + 1]]
+
+    # Number of hits at each Vth step
+    @property
+    def counts(self):
+        return np.diff(self.offsets)
+
+    # Index of the Vth step of every hit
+    @property
+    def group(self):
+        return np.repeat(np.arange(len(self.vth)), self.counts)
+
+    # Vth of every hit, aligned with values
+    @property
+    def vth_flat(self):
+        return np.repeat(self.vth, self.counts)
+
+    # Same layout with new values, e.g. after decoding or correcting the hits
+    def with_values(self, values: np.array):
+        return Ragged(values, self.offsets, self.vth)
+
+# Per-Vth count, mean and sum of squared deviations of one or more hit quantities sharing the same layout.
+# Chunks of hits are reduced with bincount and merged with the parallel Welford (Chan et al.) update,
+# so that a scan can be accumulated piece by piece without materializing all of its hits.
+class GroupedStats:
+    def __init__(self, vth: np.array, n_quantities: int = 1):
+        self.vth = np.asarray(vth)
+        self.count = np.zeros(len(self.vth))
+        self.mean = np.zeros((n_quantities, len(self.vth)))
+        self.m2 = np.zeros((n_quantities, len(self.vth)))
+
+    # Adds a chunk of hits: group is the Vth index of every hit, values is (n_quantities, n_hits)
+    def update(self, group: np.array, values: np.array):
+        values = np.atleast_2d(values)
+        n = len(self.vth)
+        count = np.bincount(group, minlength=n).astype(float)
+        safe = np.maximum(count, 1.)
+        mean = np.empty_like(self.mean)
+        m2 = np.empty_like(self.m2)
+        for k, column in enumerate(values):
+            mean[k] = np.bincount(group, weights=column, minlength=n) / safe
+            dev = column - mean[k][group]
+            m2[k] = np.bincount(group, weights=dev * dev, minlength=n)
+        self.merge_moments(count, mean, m2)
+        return self
+
+    # Merges the statistics accumulated elsewhere, e.g. by another process
+    def merge(self, other: 'GroupedStats'):
+        return self.merge_moments(other.count, other.mean, other.m2)
+
+    def merge_moments(self, count: np.array, mean: np.array, m2: np.array):
+        total = self.count + count
+        safe = np.maximum(total, 1.)
+        delta = mean - self.mean
+        self.mean = self.mean + delta * count / safe
+        self.m2 = self.m2 + m2 + delta * delta * self.count * count / safe
+        self.count = total
+        return self
+
+    # Mean, standard deviation, count and Vth of the non-empty steps, one (mean, std) pair per quantity
+    def result(self):
+        filled = self.count > 0
+        std = np.sqrt(self.m2[:, filled] / self.count[filled])
+        return self.mean[:, filled], std, self.count[filled], self.vth[filled]
+
+# Per-Vth statistics of hit quantities stored with the same offsets (e.g. ToA and ToT of the same hits), in one pass.
+# With chunk_size only that many hits are read at a time, which keeps memory-mapped scans on disk.
+def ragged_stats(*hits: Ragged, chunk_size: int = None):
+    offsets = hits[0].offsets
+    if any(not np.array_equal(other.offsets, offsets) for other in hits[1:]):
+        raise ValueError("ragged_stats needs quantities with the same layout, compute them separately")
+    stats = GroupedStats(hits[0].vth, len(hits))
+    n_hits = offsets[-1]
+    if chunk_size is None or chunk_size >= n_hits:
+        stats.update(hits[0].group, np.stack([np.asarray(h.values, dtype=np.float64) for h in hits]))
+        return stats.result()
+    for start in range(0, n_hits, chunk_size):
+        stop = min(start + chunk_size, n_hits)
+        group = np.searchsorted(offsets, np.arange(start, stop), side='right') - 1
+        stats.update(group, np.stack([np.asarray(h.values[start:stop], dtype=np.float64) for h in hits]))
+    return stats.result()
@@ -0,0 +1,183 @@
+import json
+import os
+import sqlite3
+import argparse
+from re import search
+
+# Persistent catalog of the .root files below a directory, kept in a SQLite database.
+# Each file is recorded with the metadata encoded in its path, so scripts can select the files they need
+# without walking the tree or opening ROOT files:
+#   files   path, directory, kind, vendor, module, pixel, dose, fluence, temperature, light, timestamp, voltage, mtime, size
+#   dirs    mtime and subdirectories of every directory visited
+# An update only lists the directories whose mtime changed; the others reuse the recorded subdirectories and files.
+
+CATALOG_FILE = ".results_catalog.sqlite"
+COLUMNS = ("path", "dir", "kind", "vendor", "module", "pixel", "dose", "fluence", "temperature", "light", "timestamp", "voltage", "mtime_ns", "size")
+QUERY_COLUMNS = COLUMNS[2:12]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY, dir TEXT, kind TEXT, vendor TEXT, module INTEGER, pixel TEXT, dose INTEGER, fluence TEXT,
+    temperature INTEGER, light TEXT, timestamp TEXT, voltage TEXT, mtime_ns INTEGER, size INTEGER
+);
+CREATE INDEX IF NOT EXISTS files_dir ON files (dir);
+CREATE TABLE IF NOT EXISTS dirs (path TEXT PRIMARY KEY, mtime_ns INTEGER, subdirs TEXT);
+"""
+
+# Metadata of a .root file from its path (relative to the catalog root):
+# kind is 'qinj' for the results_mod* files of qinj_engine.py, 'toa_tot' for the <timestamp>_<voltage>.root
+# histogram files of toatot_root.py and 'other' for anything else
+def parse_metadata(relpath: str):
+    name = os.path.basename(relpath)
+    if name.startswith("results_mod"):
+        kind = "qinj"
+    elif search(r'^\d{4}(?:-\d{2}){5}_\w+\.root$', name):
+        kind = "toa_tot"
+    else:
+        kind = "other"
+
+    vendor_match = search(r'(FBK|HPK)', relpath)
+    module_match = search(r'mod(\d+)', name)
+    pixel_match = search(r'_(\d+-\d+)_', name)
+    dose_match = search(r'(\d+)[eE](\d+)', relpath)
+    temperature_match = search(r'_(-?\d+)C', name)
+    timestamp_match = search(r'(\d{4}(?:-\d{2}){5})', name)
+    voltage_match = search(r'_(\d+V)', name)
+
+    if "roomT" in name:
+        temperature = 22
+    elif temperature_match:
+        temperature = int(temperature_match.group(1))
+    else:
+        temperature = -20 if kind == "qinj" else None
+
+    return {
+        "kind": kind,
+        "vendor": vendor_match.group(1) if vendor_match else None,
+        "module": int(module_match.group(1)) if module_match else None,
+        "pixel": pixel_match.group(1) if pixel_match else None,
+        "dose": int(dose_match.group(1)) if dose_match else None,
+        "fluence": f"{dose_match.group(1)}e{dose_match.group(2)}" if dose_match else None,
+        "temperature": temperature,
+        "light": "on" if "lighton" in name else "off",
+        "timestamp": timestamp_match.group(1) if timestamp_match else None,
+        "voltage": voltage_match.group(1) if voltage_match else None,
+    }
+
+class ResultsCatalog:
+    def __init__(self, root_dir: str = None, db_path: str = None):
+        self.root_dir = os.path.abspath(root_dir or os.getcwd())
+        self.db_path = db_path or os.path.join(self.root_dir, CATALOG_FILE)
+        # Stages of pipeline.py may update the same catalog at the same time, wait for the lock instead of failing
+        self.db = sqlite3.connect(self.db_path, timeout=60.)
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # Brings the catalog up to date with the files on disk, returns the number of added, updated and removed files.
+    # As the original os.walk search, the files placed directly in the root directory are not catalogued
+    def update(self):
+        counts = [0, 0, 0]
+        pending = [self.root_dir]
+        while pending:
+            dirpath = pending.pop()
+            pending.extend(self.update_dir(dirpath, counts))
+        self.db.commit()
+        return tuple(counts)
+
+    # Refreshes one directory and returns its subdirectories
+    def update_dir(self, dirpath: str, counts: list):
+        try:
+            mtime_ns = os.stat(dirpath).st_mtime_ns
+        except FileNotFoundError:
+            self.forget(dirpath, counts)
+            return []
+        row = self.db.execute("SELECT mtime_ns, subdirs FROM dirs WHERE path = ?", (dirpath,)).fetchone()
+        known = {path: (mtime, size) for path, mtime, size in self.db.execute("SELECT path, mtime_ns, size FROM files WHERE dir = ?", (dirpath,))}
+
+        if row and row[0] == mtime_ns:
+            # Same entries as last time: only check the catalogued files, which may have been rewritten in place
+            subdirs = json.loads(row[1])
+            files = list(known)
+        else:
+            subdirs = []
+            files = []
+            with os.scandir(dirpath) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False) and not entry.name.startswith('.'):
+                        subdirs.append(entry.path)
+                    elif entry.name.endswith(".root") and dirpath != self.root_dir:
+                        files.append(entry.path)
+            for old in json.loads(row[1]) if row else []:
+                if old not in subdirs:
+                    self.forget(old, counts)
+            self.db.execute("INSERT OR REPLACE INTO dirs VALUES (?, ?, ?)", (dirpath, mtime_ns, json.dumps(subdirs)))
+
+        present = set()
+        for path in files:
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            present.add(path)
+            if known.get(path) == (stat.st_mtime_ns, stat.st_size):
+                continue
+            counts[1 if path in known else 0] += 1
+            meta = parse_metadata(os.path.relpath(path, self.root_dir))
+            values = (path, dirpath) + tuple(meta[key] for key in QUERY_COLUMNS) + (stat.st_mtime_ns, stat.st_size)
+            self.db.execute(f"INSERT OR REPLACE INTO files VALUES ({', '.join('?' * len(COLUMNS))})", values)
+        for path in set(known) - present:
+            self.db.execute("DELETE FROM files WHERE path = ?", (path,))
+            counts[2] += 1
+        return subdirs
+
+    # Removes a directory that no longer exists, with everything below it
+    def forget(self, dirpath: str, counts: list):
+        prefix = dirpath.rstrip(os.sep) + os.sep
+        pattern = prefix.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        counts[2] += self.db.execute("DELETE FROM files WHERE dir = ? OR dir LIKE ? ESCAPE '\\'", (dirpath, pattern)).rowcount
+        self.db.execute("DELETE FROM dirs WHERE path = ? OR path LIKE ? ESCAPE '\\'", (dirpath, pattern))
+
+    # Catalogued files matching all the given metadata, e.g. records(kind='qinj', temperature=-20), as dicts sorted by path
+    def records(self, **filters):
+        unknown = set(filters) - set(QUERY_COLUMNS)
+        if unknown:
+            raise ValueError(f"Cannot select on {', '.join(sorted(unknown))}, available columns: {', '.join(QUERY_COLUMNS)}")
+        where = " AND ".join(f"{key} IS ?" for key in filters)
+        query = f"SELECT {', '.join(COLUMNS)} FROM files" + (f" WHERE {where}" if where else "") + " ORDER BY path"
+        return [dict(zip(COLUMNS, row)) for row in self.db.execute(query, tuple(filters.values()))]
+
+    def paths(self, **filters):
+        return [record["path"] for record in self.records(**filters)]
+
+# Drop-in replacement of the os.walk search of the scripts: updates the catalog of the current directory and
+# returns the paths of the .root files matching the filters
+def find_root_files(root_dir: str = None, **filters):
+    with ResultsCatalog(root_dir) as catalog:
+        catalog.update()
+        return catalog.paths(**filters)
+
+# Main part of the script: update the catalog and list its content
+if __name__ == "__main__":
+    argParser = argparse.ArgumentParser(description='Update and query the catalog of the ROOT result files')
+    argParser.add_argument('--path', action='store', default='.', type=str, help='Directory catalogued')
+    argParser.add_argument('--kind', action='store', default=None, type=str, help='Select the kind of file (qinj, toa_tot, other)')
+    argParser.add_argument('--vendor', action='store', default=None, type=str, help='Select the sensor vendor (FBK, HPK)')
+    argParser.add_argument('--dose', action='store', default=None, type=int, help='Select the dose, in units of 1e14 neq/cm^2')
+    argParser.add_argument('--temperature', action='store', default=None, type=int, help='Select the temperature in C')
+    argParser.add_argument('--light', action='store', default=None, type=str, help='Select the light status (on, off)')
+    args = argParser.parse_args()
+
+    filters = {key: getattr(args, key) for key in ("kind", "vendor", "dose", "temperature", "light") if getattr(args, key) is not None}
+    with ResultsCatalog(args.path) as catalog:
+        added, updated, removed = catalog.update()
+        print(f"Catalog {catalog.db_path}: {added} added, {updated} updated, {removed} removed")
+        for record in catalog.records(**filters):
+            print(f"{os.path.relpath(record['path'], catalog.root_dir)}  kind={record['kind']} dose={record['dose']} T={record['temperature']} light={record['light']} module={record['module']} pixel={record['pixel']}")
@@ -0,0 +1,132 @@
+import os
+import numpy as np
+from lazy import ROOT, optional_import
+
+# Columnar access to the qinj_results trees written by qinj_engine.py.
+# Files are read and written with uproot when it is installed, which needs neither PyROOT nor cling, and with
+# RDataFrame otherwise. Columns can also be saved as a Parquet or HDF5 sidecar for readers without ROOT.
+
+QINJ_BRANCHES = ("charge", "width", "HM_left", "sigma_left", "sigma_right", "timestamp", "voltage", "current")
+# Type of every branch of qinj_results: charge/I and voltage/I, the others /D
+QINJ_DTYPES = {
+    "charge": np.int32,
+    "width": np.float64,
+    "HM_left": np.float64,
+    "sigma_left": np.float64,
+    "sigma_right": np.float64,
+    "timestamp": np.float64,
+    "voltage": np.int32,
+    "current": np.float64
+}
+SIDECAR_FORMATS = {"parquet": ".parquet", "hdf5": ".h5"}
+# Files written by the old read_outputs_qinj scripts of the RT series store HM_left in a branch called HM_lleft
+BRANCH_ALIASES = {"HM_left": ("HM_lleft",)}
+
+# Branch of the file read for every requested column, columns without branch are left out
+def match_branches(branches: set, columns: tuple):
+    sources = {}
+    for column in columns:
+        for name in (column,) + BRANCH_ALIASES.get(column, ()):
+            if name in branches:
+                sources[column] = name
+                break
+    return sources
+
+def read_arrays_uproot(uproot, file_name: str, columns: tuple, tree_name: str):
+    try:
+        file = uproot.open(file_name)
+    except (OSError, ValueError):
+        return None
+    with file:
+        if tree_name not in file:
+            return None
+        tree = file[tree_name]
+        sources = match_branches(set(tree.keys()), columns)
+        arrays = tree.arrays(sorted(set(sources.values())), library="np") if sources else {}
+        return sources, arrays, tree.num_entries
+
+def read_arrays_root(file_name: str, columns: tuple, tree_name: str):
+    file = ROOT.TFile.Open(file_name)
+    if not file or file.IsZombie():
+        return None
+    tree = file.Get(tree_name)
+    if not tree:
+        file.Close()
+        return None
+    sources = match_branches({branch.GetName() for branch in tree.GetListOfBranches()}, columns)
+    n_entries = tree.GetEntries()
+    arrays = ROOT.RDataFrame(tree).AsNumpy(sorted(set(sources.values()))) if sources else {}
+    file.Close()
+    return sources, arrays, n_entries
+
+# Reads the requested branches of a results file as NumPy arrays in one call
+# Returns None if the file has no qinj_results tree; branches that are missing come back as zeros
+# backend is "auto" (uproot if installed, else ROOT), "uproot" or "root"
+def read_results(file_name: str, columns: tuple = QINJ_BRANCHES, tree_name: str = "qinj_results", backend: str = "auto"):
+    uproot = optional_import("uproot") if backend in ("auto", "uproot") else None
+    if backend == "uproot" and uproot is None:
+        raise ImportError("The uproot backend of read_results needs uproot (pip install uproot)")
+    if uproot is not None:
+        read = read_arrays_uproot(uproot, file_name, columns, tree_name)
+    else:
+        read = read_arrays_root(file_name, columns, tree_name)
+    if read is None:
+        return None
+    sources, arrays, n_entries = read
+
+    data = {}
+    for column in columns:
+        if column in sources:
+            data[column] = np.asarray(arrays[sources[column]])
+        else:
+            data[column] = np.zeros(n_entries)
+    return data
+
+# Columns of the results as contiguous arrays of the qinj_results types, other columns keep their own type
+def as_columns(columns: dict):
+    return {name: np.ascontiguousarray(values, dtype=QINJ_DTYPES.get(name)) for name, values in columns.items()}
+
+def write_arrays_uproot(uproot, file_name: str, columns: dict, tree_name: str):
+    with uproot.recreate(file_name) as file:
+        file.mktree(tree_name, {name: values.dtype for name, values in columns.items()}, title=tree_name)
+        file[tree_name].extend(columns)
+
+def write_arrays_root(file_name: str, columns: dict, tree_name: str):
+    # RDF.FromNumpy is called MakeNumpyDataFrame before ROOT 6.28
+    from_numpy = getattr(ROOT.RDF, "FromNumpy", None) or ROOT.RDF.MakeNumpyDataFrame
+    from_numpy(columns).Snapshot(tree_name, file_name, list(columns))
+
+# Writes all the columns of a results tree in one call, one entry per element, instead of filling it row by row
+# backend is "auto" (uproot if installed, else ROOT), "uproot" or "root"
+def write_results(file_name: str, columns: dict, tree_name: str = "qinj_results", backend: str = "auto"):
+    columns = as_columns(columns)
+    uproot = optional_import("uproot") if backend in ("auto", "uproot") else None
+    if backend == "uproot" and uproot is None:
+        raise ImportError("The uproot backend of write_results needs uproot (pip install uproot)")
+    if uproot is not None:
+        write_arrays_uproot(uproot, file_name, columns, tree_name)
+    else:
+        write_arrays_root(file_name, columns, tree_name)
+
+# Saves the columns next to a results file as <name>.parquet or <name>.h5 and returns the sidecar file name
+# Parquet needs pyarrow, HDF5 needs h5py
+def write_sidecar(file_name: str, columns: dict, sidecar_format: str = "parquet", tree_name: str = "qinj_results"):
+    if sidecar_format not in SIDECAR_FORMATS:
+        raise ValueError(f"Unknown sidecar format '{sidecar_format}', choose between {', '.join(SIDECAR_FORMATS)}")
+    columns = as_columns(columns)
+    sidecar_name = os.path.splitext(file_name)[0] + SIDECAR_FORMATS[sidecar_format]
+    if sidecar_format == "parquet":
+        pyarrow = optional_import("pyarrow")
+        parquet = optional_import("pyarrow.parquet")
+        if pyarrow is None or parquet is None:
+            raise ImportError("Parquet sidecars need pyarrow (pip install pyarrow)")
+        parquet.write_table(pyarrow.table(columns), sidecar_name)
+    else:
+        h5py = optional_import("h5py")
+        if h5py is None:
+            raise ImportError("HDF5 sidecars need h5py (pip install h5py)")
+        with h5py.File(sidecar_name, "w") as file:
+            group = file.create_group(tree_name)
+            for name, values in columns.items():
+                group.create_dataset(name, data=values)
+    return sidecar_name
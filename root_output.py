@@ -0,0 +1,133 @@
+import os
+import argparse
+from lazy import ROOT
+
+# Write-once ROOT output files.
+# A RootOutput collects the objects of one file in memory and writes them in a single RECREATE pass, with an explicit
+# compression setting, to a temporary file that then replaces the old one. With update=True the objects already in
+# the file are carried over, except the ones replaced: the file never accumulates the dead space and the extra key
+# cycles left by Write(..., kOverwrite) in UPDATE mode.
+# Run as a script it compacts existing files the same way:
+#   python3 root_output.py ToA_ToT --compression zstd:5
+
+# Compression algorithms of ROOT (ROOT::RCompressionSetting::EAlgorithm)
+COMPRESSION_ALGORITHMS = {"zlib": 1, "lzma": 2, "lz4": 4, "zstd": 5}
+DEFAULT_COMPRESSION = "zstd:5"
+
+# Compression setting of TFile from "<algorithm>:<level>", e.g. "zstd:5" -> 505, "lzma:9" -> 209, "none" -> 0
+def parse_compression(setting: str):
+    if setting in ("none", "0"):
+        return 0
+    algorithm, _, level = setting.partition(":")
+    if algorithm not in COMPRESSION_ALGORITHMS:
+        raise ValueError(f"Unknown compression algorithm '{algorithm}', choose between {', '.join(COMPRESSION_ALGORITHMS)}")
+    level = int(level) if level else 5
+    if not 1 <= level <= 9:
+        raise ValueError(f"Compression level must be between 1 and 9, got {level}")
+    return COMPRESSION_ALGORITHMS[algorithm] * 100 + level
+
+# Name and class of the objects of a directory, newest cycle only, in the order of the keys
+def latest_keys(directory):
+    keys = {}
+    for key in directory.GetListOfKeys():
+        name = key.GetName()
+        if name not in keys or key.GetCycle() > keys[name][0]:
+            keys[name] = (key.GetCycle(), key.GetClassName())
+    return [(name, class_name) for name, (cycle, class_name) in keys.items()]
+
+# Copies the newest cycle of every object of source into target, subdirectories included, skipping the names in skip
+def copy_directory(source, target, skip: set = frozenset()):
+    for name, class_name in latest_keys(source):
+        if name in skip:
+            continue
+        obj_class = ROOT.TClass.GetClass(class_name)
+        obj = source.Get(name)
+        if obj_class.InheritsFrom("TDirectory"):
+            copy_directory(obj, target.mkdir(name))
+        elif obj_class.InheritsFrom("TTree"):
+            # Not a fast clone, so that the baskets are compressed again with the new setting
+            target.cd()
+            obj.CloneTree(-1).Write(name)
+        else:
+            target.WriteTObject(obj, name)
+
+class RootOutput:
+    def __init__(self, path: str, compression: str = DEFAULT_COMPRESSION, update: bool = False):
+        self.path = path
+        self.compression = parse_compression(compression)
+        self.update = update
+        self.objects = {}
+
+    # Adds an object to the file, replacing any object with the same name
+    def add(self, obj, name: str):
+        # Fit results come as TFitResultPtr from TH1::Fit(..., 'S'): the TFitResult is deleted with its last pointer,
+        # which callers usually overwrite at the next fit, so a copy owned by the output is stored instead
+        if isinstance(obj, ROOT.TFitResultPtr):
+            obj = ROOT.TFitResult(obj.Get())
+        # Histograms must not belong to the input file, which may be closed before write()
+        if isinstance(obj, ROOT.TH1):
+            obj.SetDirectory(ROOT.nullptr)
+        self.objects[name] = obj
+        return obj
+
+    def __contains__(self, name: str):
+        return name in self.objects
+
+    # Writes the file once; the previous content, if kept, is copied first
+    def write(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        outfile = ROOT.TFile(tmp_path, "RECREATE", "", self.compression)
+        if self.update and os.path.exists(self.path):
+            infile = ROOT.TFile.Open(self.path, "READ")
+            copy_directory(infile, outfile, set(self.objects))
+            infile.Close()
+        outfile.cd()
+        for name, obj in self.objects.items():
+            outfile.WriteTObject(obj, name)
+        outfile.Close()
+        os.replace(tmp_path, self.path)
+        self.objects = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.write()
+
+# Rewrites a file with the newest cycle of each object only, returns its size before and after
+def compact(path: str, compression: str = DEFAULT_COMPRESSION):
+    size_before = os.path.getsize(path)
+    RootOutput(path, compression, update=True).write()
+    return size_before, os.path.getsize(path)
+
+# ROOT files given directly or found below the given directories
+def list_root_files(paths: list):
+    files = []
+    for path in paths:
+        if os.path.isfile(path):
+            files.append(path)
+            continue
+        for root, dirs, filenames in os.walk(path):
+            files += [os.path.join(root, filename) for filename in sorted(filenames) if filename.endswith(".root")]
+    return files
+
+# Main part of the script
+if __name__ == "__main__":
+    argParser = argparse.ArgumentParser(description='Compact ROOT files: keep the newest cycle of each object and recompress')
+    argParser.add_argument('paths', action='store', nargs='+', type=str, help='ROOT files or directories to search for them')
+    argParser.add_argument('--compression', action='store', default=DEFAULT_COMPRESSION, type=str, help='Compression as algorithm:level (zlib, lzma, lz4, zstd) or none')
+    args = argParser.parse_args()
+    parse_compression(args.compression)
+
+    ROOT.gROOT.SetBatch(True)
+    total_before = total_after = 0
+    for path in list_root_files(args.paths):
+        size_before, size_after = compact(path, args.compression)
+        total_before += size_before
+        total_after += size_after
+        print(f"{path}: {size_before/1024:.1f} kB -> {size_after/1024:.1f} kB")
+    print(f"Total: {total_before/1024**2:.2f} MB -> {total_after/1024**2:.2f} MB")
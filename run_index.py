@@ -0,0 +1,90 @@
+import json
+import os
+import argparse
+from re import search
+from scan_cache import CACHE_DIR
+
+# Index of the run directories of module_test/results/<module>/, whose names carry timestamp, bias, temperature,
+# pixel and fluence (e.g. "2024-10-11-10-08-23_150V_-20C_15-7_15e14").
+# Every results directory is listed and parsed once, the index is stored in <cache_dir>/run_index.json
+# and rebuilt only for the directories whose mtime changed (a run directory was added, removed or renamed).
+
+INDEX_FILE = "run_index.json"
+
+# Extracts bias, temperature, pixel and fluence from a run directory name without its timestamp
+def extract_info(s: str):
+    voltage_match = search(r'(\d+V)', s)
+    voltage = voltage_match.group(1) if voltage_match else None
+
+    temperature_match = search(r'(-?\d+C)', s)
+    temperature = temperature_match.group(1) if temperature_match else None
+
+    pixel_match = search(r'(\d+-\d+)', s)
+    pixel = pixel_match.group(1) if pixel_match else None
+
+    fluence_match = search(r'(\d+e\d+)', s)
+    fluence = fluence_match.group(0) if fluence_match else '0e14'
+
+    return voltage, temperature, pixel, fluence
+
+# Parses all the run directories of a results directory into {timestamp: [voltage, temperature, pixel, fluence]}
+def parse_run_dirs(results_dir: str):
+    runs = {}
+    for entry in sorted(os.listdir(results_dir)):
+        timestamp_match = search(r'\d{4}(?:-\d{2}){5}', entry)
+        if not timestamp_match or not os.path.isdir(os.path.join(results_dir, entry)):
+            continue
+        timestamp = timestamp_match.group(0)
+        runs[timestamp] = list(extract_info(entry.replace(timestamp, "")))
+    return runs
+
+class RunIndex:
+    def __init__(self, cache_dir: str = CACHE_DIR):
+        self.filename = os.path.join(cache_dir, INDEX_FILE)
+        self.entries = {}
+        self.changed = False
+        try:
+            with open(self.filename, 'r') as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+    # Runs of a results directory as {timestamp: (voltage, temperature, pixel, fluence)}, parsed again only if the directory changed
+    def runs(self, results_dir: str):
+        key = os.path.abspath(results_dir)
+        mtime_ns = os.stat(key).st_mtime_ns
+        entry = self.entries.get(key)
+        if entry is None or entry["mtime_ns"] != mtime_ns:
+            entry = {"mtime_ns": mtime_ns, "runs": parse_run_dirs(key)}
+            self.entries[key] = entry
+            self.changed = True
+        return {timestamp: tuple(info) for timestamp, info in entry["runs"].items()}
+
+    # Voltage, temperature, pixel and fluence of one timestamp, None for a timestamp without run directory
+    def lookup(self, results_dir: str, timestamp: str):
+        return self.runs(results_dir).get(timestamp, (None, None, None, None))
+
+    # Writes the index if something was parsed again, through a temporary file so readers never see a partial index
+    def save(self):
+        if not self.changed:
+            return
+        os.makedirs(os.path.dirname(self.filename) or ".", exist_ok=True)
+        tmpname = f"{self.filename}.{os.getpid()}.tmp"
+        with open(tmpname, 'w') as f:
+            json.dump(self.entries, f)
+        os.replace(tmpname, self.filename)
+        self.changed = False
+
+# Main part of the script: build or refresh the index of some results directories
+if __name__ == "__main__":
+    argParser = argparse.ArgumentParser(description='Index the run directories of module_test/results')
+    argParser.add_argument('--path', action='store', default='./module_test/results/', type=str, help='Results directory, every module subdirectory is indexed')
+    argParser.add_argument('--cache_dir', action='store', default=CACHE_DIR, type=str, help='Directory where the index is stored')
+    args = argParser.parse_args()
+
+    index = RunIndex(args.cache_dir)
+    for module in sorted(os.listdir(args.path)):
+        module_dir = os.path.join(args.path, module)
+        if os.path.isdir(module_dir):
+            print(f"{module_dir}: {len(index.runs(module_dir))} runs")
+    index.save()
@@ -0,0 +1,105 @@
+import json
+import os
+import argparse
+import numpy as np
+from itertools import chain
+from concurrent.futures import ProcessPoolExecutor
+
+# Binary cache of the decoded Qinj_scan json files.
+# Every scan is stored as a directory of .npy files, keyed by module/timestamp/file name:
+#   vth.npy, hits.npy                    one value per Vth step
+#   toa_values.npy, toa_offsets.npy      ragged per-Vth hit lists, hits of step i are values[offsets[i]:offsets[i+1]]
+#   tot_values.npy, tot_offsets.npy
+#   meta.json                            size and mtime of the source json, used to detect stale entries
+# Loading memory-maps the arrays, so later reads do not copy or decode anything.
+
+CACHE_DIR = "./module_test/cache/"
+SCAN_KEYS = ("vth", "hits")
+RAGGED_KEYS = ("toa", "tot")
+
+# Flattens a list of per-Vth hit lists into a flat values array and an offsets array
+def flatten(nested: list):
+    lengths = np.fromiter((len(sublist) for sublist in nested), dtype=np.int64, count=len(nested))
+    offsets = np.zeros(len(nested) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    values = np.fromiter(chain.from_iterable(nested), dtype=np.float64, count=offsets[-1])
+    return values, offsets
+
+# Directory of the cache entry of a json file: the path after "outputs" (module/timestamp/file) or the last three components
+def cache_path(json_path: str, cache_dir: str = CACHE_DIR):
+    parts = os.path.abspath(json_path).split(os.sep)
+    parts[-1] = os.path.splitext(parts[-1])[0]
+    if "outputs" in parts:
+        key = parts[len(parts) - parts[::-1].index("outputs"):]
+    else:
+        key = parts[-3:]
+    return os.path.join(cache_dir, *key)
+
+def is_fresh(json_path: str, target: str):
+    try:
+        with open(os.path.join(target, "meta.json"), 'r') as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return False
+    stat = os.stat(json_path)
+    return meta["mtime_ns"] == stat.st_mtime_ns and meta["size"] == stat.st_size
+
+# Decodes a json scan once and writes its arrays to the cache
+def convert_scan(json_path: str, cache_dir: str = CACHE_DIR):
+    with open(json_path, 'r') as f:
+        data = json.load(f)
+    arrays = {key: np.asarray(data[key], dtype=np.float64) for key in SCAN_KEYS if key in data}
+    for key in RAGGED_KEYS:
+        if key in data:
+            arrays[f"{key}_values"], arrays[f"{key}_offsets"] = flatten(data[key])
+
+    target = cache_path(json_path, cache_dir)
+    os.makedirs(target, exist_ok=True)
+    for name, array in arrays.items():
+        np.save(os.path.join(target, name + ".npy"), array)
+    # The metadata is written last, so an interrupted conversion is never taken as valid
+    stat = os.stat(json_path)
+    with open(os.path.join(target, "meta.json"), 'w') as f:
+        json.dump({"source": os.path.abspath(json_path), "mtime_ns": stat.st_mtime_ns, "size": stat.st_size, "arrays": list(arrays)}, f)
+    return target
+
+# Returns the arrays of a scan as read-only memory maps, converting the json first if the cache is missing or stale
+def load_scan(json_path: str, cache_dir: str = CACHE_DIR):
+    target = cache_path(json_path, cache_dir)
+    if not is_fresh(json_path, target):
+        convert_scan(json_path, cache_dir)
+    with open(os.path.join(target, "meta.json"), 'r') as f:
+        meta = json.load(f)
+    return {name: np.load(os.path.join(target, name + ".npy"), mmap_mode='r') for name in meta["arrays"]}
+
+# Lists the Qinj_scan json files below a directory
+def find_scans(path: str):
+    scans = []
+    for dirpath, dirnames, filenames in os.walk(path):
+        for file in filenames:
+            if file.startswith("Qinj_scan") and file.endswith(".json"):
+                scans.append(os.path.join(dirpath, file))
+    return sorted(scans)
+
+def convert_if_stale(json_path: str, cache_dir: str = CACHE_DIR):
+    if is_fresh(json_path, cache_path(json_path, cache_dir)):
+        return False
+    convert_scan(json_path, cache_dir)
+    return True
+
+# Main part of the script: one-time conversion of all the scans
+if __name__ == "__main__":
+    argParser = argparse.ArgumentParser(description='Convert the Qinj_scan json files to the binary cache')
+    argParser.add_argument('--path', action='store', default='./module_test/outputs/', type=str, help='Directory searched for Qinj_scan json files')
+    argParser.add_argument('--cache_dir', action='store', default=CACHE_DIR, type=str, help='Directory of the binary cache')
+    argParser.add_argument('--jobs', action='store', default=1, type=int, help='Number of worker processes (0 = all cores)')
+    args = argParser.parse_args()
+
+    scans = find_scans(args.path)
+    n_jobs = args.jobs if args.jobs > 0 else os.cpu_count()
+    if n_jobs > 1:
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            converted = list(executor.map(convert_if_stale, scans, [args.cache_dir] * len(scans)))
+    else:
+        converted = [convert_if_stale(scan, args.cache_dir) for scan in scans]
+    print(f"Converted {sum(converted)} of {len(scans)} scans into {args.cache_dir}")
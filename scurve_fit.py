@@ -0,0 +1,286 @@
+import numpy as np
+from scipy.special import erf, erfc
+
+# Batch fitter for the edges of the Qinj S curves, without ROOT TGraph/TF1.
+# All the curves of a batch (charges, pixels, timestamps) are fitted at once with a
+# vectorized Levenberg-Marquardt minimization. Parameters follow the ROOT formulas:
+#   erf:  TMath::Erf((x-[0])/[1])*[2]+[3]
+#   erfc: TMath::Erfc((x-[0])/[1])*[2]+[3]
+#   gaus: [0]*exp(-0.5*((x-[1])/[2])**2)
+
+SQRT_2LN2 = np.sqrt(2 * np.log(2))
+TWO_OVER_SQRTPI = 2. / np.sqrt(np.pi)
+
+# Model value and jacobian for a batch of curves: x is (n, m), p is (n, k)
+def model_erf(x: np.array, p: np.array):
+    mu, s, a, c = (p[:, k, None] for k in range(4))
+    z = (x - mu) / s
+    dz = a * TWO_OVER_SQRTPI * np.exp(-z * z)
+    jac = np.stack([-dz / s, -dz * z / s, erf(z), np.ones_like(z)], axis=-1)
+    return erf(z) * a + c, jac
+
+def model_erfc(x: np.array, p: np.array):
+    mu, s, a, c = (p[:, k, None] for k in range(4))
+    z = (x - mu) / s
+    dz = a * TWO_OVER_SQRTPI * np.exp(-z * z)
+    jac = np.stack([dz / s, dz * z / s, erfc(z), np.ones_like(z)], axis=-1)
+    return erfc(z) * a + c, jac
+
+def model_gaus(x: np.array, p: np.array):
+    a, mu, s = (p[:, k, None] for k in range(3))
+    z = (x - mu) / s
+    e = np.exp(-0.5 * z * z)
+    jac = np.stack([e, a * e * z / s, a * e * z * z / s], axis=-1)
+    return a * e, jac
+
+MODELS = {
+    "erf": model_erf,
+    "erfc": model_erfc,
+    "gaus": model_gaus
+}
+
+# Stacks curves of different length into (n, m) arrays padded with NaN
+def stack_curves(vths: list, hitss: list):
+    n_points = max(len(vth) for vth in vths)
+    vth = np.full((len(vths), n_points), np.nan)
+    hits = np.full((len(vths), n_points), np.nan)
+    for i, (v, h) in enumerate(zip(vths, hitss)):
+        vth[i, :len(v)] = v
+        hits[i, :len(h)] = h
+    return vth, hits
+
+# Selects the points of every curve inside its [low, high] window
+def window_mask(vth: np.array, hits: np.array, low: np.array, high: np.array):
+    low = np.broadcast_to(np.asarray(low, dtype=float), vth.shape[:1])
+    high = np.broadcast_to(np.asarray(high, dtype=float), vth.shape[:1])
+    return np.isfinite(vth) & np.isfinite(hits) & (vth >= low[:, None]) & (vth <= high[:, None])
+
+# Data-driven starting values for the parameters of each curve
+def initial_params(model: str, vth: np.array, hits: np.array, mask: np.array, low: np.array, high: np.array):
+    low = np.broadcast_to(np.asarray(low, dtype=float), vth.shape[:1])
+    high = np.broadcast_to(np.asarray(high, dtype=float), vth.shape[:1])
+    y_max = np.where(mask, hits, -np.inf).max(axis=1)
+    y_min = np.where(mask, hits, np.inf).min(axis=1)
+    empty = ~mask.any(axis=1)
+    y_max[empty], y_min[empty] = 1., 0.
+    if model == "gaus":
+        weights = np.where(mask, np.clip(hits, 0., None), 0.)
+        norm = np.maximum(weights.sum(axis=1), 1e-12)
+        mean = (np.where(mask, vth, 0.) * weights).sum(axis=1) / norm
+        var = (np.where(mask, vth - mean[:, None], 0.) ** 2 * weights).sum(axis=1) / norm
+        mean = np.where(empty, (low + high) / 2., mean)
+        sigma = np.where(var > 0, np.sqrt(var), (high - low) / 4.)
+        return np.stack([y_max, mean, np.maximum(sigma, 1e-3)], axis=1)
+    return np.stack([(low + high) / 2., np.maximum((high - low) / 4., 1e-3), (y_max - y_min) / 2., (y_max + y_min) / 2.], axis=1)
+
+# Vectorized Levenberg-Marquardt least squares over a batch of curves
+# Returns the best parameters, the chi2 and the number of degrees of freedom of each curve
+def batch_least_squares(model: str, vth: np.array, hits: np.array, mask: np.array, p0: np.array, max_iter: int = 200, tol: float = 1e-10):
+    func = MODELS[model]
+    x = np.where(mask, vth, 0.)
+    y = np.where(mask, hits, 0.)
+    w = mask.astype(float)
+    p = np.array(p0, dtype=float)
+    n, k = p.shape
+    lam = np.full(n, 1e-3)
+    active = mask.sum(axis=1) > k
+
+    with np.errstate(all='ignore'):
+        f, jac = func(x, p)
+        r = (y - f) * w
+        chi2 = (r * r).sum(axis=1)
+        for _ in range(max_iter):
+            # Only the curves still improving are computed, the others keep their parameters
+            act = np.flatnonzero(active)
+            if len(act) == 0:
+                break
+            jw = jac[act] * w[act, :, None]
+            jtj = np.einsum('nmk,nml->nkl', jw, jw)
+            jtr = np.einsum('nmk,nm->nk', jw, r[act])
+            diag = np.maximum(np.diagonal(jtj, axis1=1, axis2=2), 1e-12)
+            damped = jtj + lam[act, None, None] * (np.eye(k) * diag[:, None, :])
+            damped[~np.isfinite(damped).all(axis=(1, 2))] = np.eye(k)
+            step = np.linalg.solve(damped, np.nan_to_num(jtr)[..., None])[..., 0]
+
+            p_new = p[act] + step
+            f_new, jac_new = func(x[act], p_new)
+            r_new = (y[act] - f_new) * w[act]
+            chi2_new = (r_new * r_new).sum(axis=1)
+
+            better = np.isfinite(chi2_new) & (chi2_new <= chi2[act])
+            # Converged when a step no longer changes the chi2, accepted or not: a fit started at its minimum stops
+            # after one step instead of raising the damping until it gives up
+            converged = np.isfinite(chi2_new) & (np.abs(chi2[act] - chi2_new) <= tol * np.maximum(chi2[act], 1e-12))
+            improved = act[better]
+            p[improved] = p_new[better]
+            jac[improved] = jac_new[better]
+            r[improved] = r_new[better]
+            chi2[improved] = chi2_new[better]
+            lam[act] = np.where(better, lam[act] * 0.3, lam[act] * 10.)
+            active[act] = ~converged & (lam[act] < 1e12)
+
+    ndf = mask.sum(axis=1) - k
+    return p, chi2, ndf
+
+# Fits the left and right edges of a batch of S curves
+# vth and hits are (n_curves, n_points) arrays (see stack_curves), the limits are scalars or (n_curves,) arrays
+# Returns the same quantities stored in the qinj_results tree, plus the raw fit parameters
+def fit_edges(vth: np.array, hits: np.array, low_left, high_left, low_right, high_right, left_model: str = "erf", p0_left: np.array = None, p0_right: np.array = None):
+    vth = np.atleast_2d(np.asarray(vth, dtype=float))
+    hits = np.atleast_2d(np.asarray(hits, dtype=float))
+
+    mask_left = window_mask(vth, hits, low_left, high_left)
+    mask_right = window_mask(vth, hits, low_right, high_right)
+    if p0_left is None:
+        p0_left = initial_params(left_model, vth, hits, mask_left, low_left, high_left)
+    if p0_right is None:
+        p0_right = initial_params("erfc", vth, hits, mask_right, low_right, high_right)
+
+    par_left, chi2_left, ndf_left = batch_least_squares(left_model, vth, hits, mask_left, p0_left)
+    par_right, chi2_right, ndf_right = batch_least_squares("erfc", vth, hits, mask_right, p0_right)
+
+    if left_model == "gaus":
+        sigma_left = np.abs(par_left[:, 2])
+        HM_left = par_left[:, 1] - sigma_left * SQRT_2LN2
+    else:
+        sigma_left = np.abs(par_left[:, 1])
+        HM_left = par_left[:, 0]
+    x_right = par_right[:, 0]
+
+    return {
+        "HM_left": HM_left,
+        "width": np.abs(HM_left - x_right),
+        "sigma_left": sigma_left,
+        "sigma_right": np.abs(par_right[:, 1]),
+        "params_left": par_left,
+        "params_right": par_right,
+        "chi2_left": chi2_left,
+        "chi2_right": chi2_right,
+        "ndf_left": ndf_left,
+        "ndf_right": ndf_right
+    }
+
+# Index of the edge position and of the edge width in the parameters of each model
+POSITION_INDEX = {"erf": 0, "erfc": 0, "gaus": 1}
+WIDTH_INDEX = {"erf": 1, "erfc": 1, "gaus": 2}
+
+# Vth of the edge described by the parameters: the half maximum for gaus, [0] for erf and erfc
+def edge_position(model: str, params: np.array):
+    params = np.atleast_2d(params)
+    if model == "gaus":
+        return params[:, 1] - np.abs(params[:, 2]) * SQRT_2LN2
+    return params[:, POSITION_INDEX[model]]
+
+# True for the fits that ended on a usable edge: finite parameters, non-zero width and edge inside [low, high]
+def converged_params(model: str, params: np.array, low, high):
+    params = np.atleast_2d(params)
+    edge = edge_position(model, params)
+    with np.errstate(invalid='ignore'):
+        return np.isfinite(params).all(axis=1) & (params[:, WIDTH_INDEX[model]] != 0) & (edge >= low) & (edge <= high)
+
+# Starting values of a batch of fits from the parameters of neighbouring curves already fitted (NaN rows where there is none).
+# The shape of the edge (width, amplitude, offset) is taken from the neighbour and the edge is placed at the default
+# position, since the edge moves with charge and bias while its shape changes little; where the default has no position
+# (NaN) the neighbour's is kept. Curves without neighbour keep the defaults.
+# Returns the starting values and which curves were seeded
+def warm_start(model: str, default: np.array, seed_params: np.array):
+    default = np.atleast_2d(np.asarray(default, dtype=float))
+    seed_params = np.atleast_2d(np.asarray(seed_params, dtype=float))
+    usable = np.isfinite(seed_params).all(axis=1) & (seed_params[:, WIDTH_INDEX[model]] != 0)
+    p0 = np.where(usable[:, None], seed_params, default)
+    edge = edge_position(model, p0)
+    default_edge = edge_position(model, default)
+    moved = usable & np.isfinite(default_edge)
+    p0[moved, POSITION_INDEX[model]] += default_edge[moved] - edge[moved]
+    return p0, usable
+
+# Fits the edges like fit_edges, each curve starting from the converged parameters of curve seed_from[i]
+# (e.g. the previous charge of the same pixel), or from the data-driven values if seed_from[i] is -1 or that fit failed.
+# Curves are fitted in batches, a curve being fitted after the curve it is seeded from; seed_from[i] must be smaller than i
+def fit_edges_warm(vth: np.array, hits: np.array, low_left, high_left, low_right, high_right, left_model: str = "erf", seed_from: list = None):
+    vth = np.atleast_2d(np.asarray(vth, dtype=float))
+    hits = np.atleast_2d(np.asarray(hits, dtype=float))
+    n_curves = len(vth)
+    seed_from = np.full(n_curves, -1) if seed_from is None else np.asarray(seed_from, dtype=int)
+    limits = [np.broadcast_to(np.asarray(limit, dtype=float), (n_curves,)) for limit in (low_left, high_left, low_right, high_right)]
+    low_left, high_left, low_right, high_right = limits
+
+    # Batch of every curve: one more than the batch of the curve it is seeded from
+    depth = np.zeros(n_curves, dtype=int)
+    for i, seed in enumerate(seed_from):
+        if seed >= i:
+            raise ValueError(f"Curve {i} cannot be seeded from curve {seed}, fitted after it")
+        depth[i] = depth[seed] + 1 if seed >= 0 else 0
+
+    edges = None
+    seeded = np.zeros(n_curves, dtype=bool)
+    for batch in range(depth.max() + 1 if n_curves else 0):
+        idx = np.flatnonzero(depth == batch)
+        mask_left = window_mask(vth[idx], hits[idx], low_left[idx], high_left[idx])
+        mask_right = window_mask(vth[idx], hits[idx], low_right[idx], high_right[idx])
+        p0_left = initial_params(left_model, vth[idx], hits[idx], mask_left, low_left[idx], high_left[idx])
+        p0_right = initial_params("erfc", vth[idx], hits[idx], mask_right, low_right[idx], high_right[idx])
+        if batch > 0:
+            seed = seed_from[idx]
+            ok_left = converged_params(left_model, edges["params_left"][seed], low_left[seed], high_left[seed])
+            ok_right = converged_params("erfc", edges["params_right"][seed], low_right[seed], high_right[seed])
+            seed_left = np.where(ok_left[:, None], edges["params_left"][seed], np.nan)
+            seed_right = np.where(ok_right[:, None], edges["params_right"][seed], np.nan)
+            p0_left, used_left = warm_start(left_model, p0_left, seed_left)
+            p0_right, used_right = warm_start("erfc", p0_right, seed_right)
+            seeded[idx] = used_left | used_right
+        fitted = fit_edges(vth[idx], hits[idx], low_left[idx], high_left[idx], low_right[idx], high_right[idx], left_model, p0_left, p0_right)
+        if edges is None:
+            edges = {key: np.zeros((n_curves,) + value.shape[1:], dtype=value.dtype) for key, value in fitted.items()}
+        for key, value in fitted.items():
+            edges[key][idx] = value
+    if edges is not None:
+        edges["seeded"] = seeded
+    return edges
+
+# Interpolated Vth where each curve first (rising) or last (falling) reaches the level
+def find_crossing(vth: np.array, hits: np.array, level: np.array, rising: bool = True):
+    above = np.nan_to_num(hits, nan=-np.inf) >= level[:, None]
+    found = above.any(axis=1)
+    rows = np.arange(len(vth))
+    n_points = vth.shape[1]
+    if rising:
+        idx = above.argmax(axis=1)
+        prev = np.maximum(idx - 1, 0)
+    else:
+        idx = n_points - 1 - above[:, ::-1].argmax(axis=1)
+        prev = np.minimum(idx + 1, n_points - 1)
+    x1, y1 = vth[rows, idx], hits[rows, idx]
+    x0, y0 = vth[rows, prev], hits[rows, prev]
+    with np.errstate(all='ignore'):
+        frac = np.where(np.isfinite(y0) & (y1 != y0), (level - y0) / (y1 - y0), 1.)
+        x = np.where(np.isfinite(x0), x0 + np.clip(frac, 0., 1.) * (x1 - x0), x1)
+    return np.where(found, x, np.nan)
+
+# Locates plateau and half-maximum crossings of a batch of S curves and derives the fit windows from them
+# The windows are centred on the crossings and extend by scale times the 20%-80% rise (fall) length,
+# never less than min_margin Vth units
+def find_windows(vth: np.array, hits: np.array, scale: float = 2., min_margin: float = 3.):
+    vth = np.atleast_2d(np.asarray(vth, dtype=float))
+    hits = np.atleast_2d(np.asarray(hits, dtype=float))
+    with np.errstate(all='ignore'):
+        peak = np.nanmax(np.where(np.isfinite(vth), hits, np.nan), axis=1)
+        # The plateau is the typical level of the points above half of the peak, robust against noise spikes
+        plateau = np.nanmedian(np.where(hits >= peak[:, None] / 2., hits, np.nan), axis=1)
+
+    x_rise = find_crossing(vth, hits, plateau / 2., rising=True)
+    x_fall = find_crossing(vth, hits, plateau / 2., rising=False)
+    rise = find_crossing(vth, hits, 0.8 * plateau, rising=True) - find_crossing(vth, hits, 0.2 * plateau, rising=True)
+    fall = find_crossing(vth, hits, 0.2 * plateau, rising=False) - find_crossing(vth, hits, 0.8 * plateau, rising=False)
+    margin_left = np.maximum(scale * np.nan_to_num(np.abs(rise)), min_margin)
+    margin_right = np.maximum(scale * np.nan_to_num(np.abs(fall)), min_margin)
+
+    return {
+        "plateau": plateau,
+        "x_rise": x_rise,
+        "x_fall": x_fall,
+        "low_left": x_rise - margin_left,
+        "high_left": x_rise + margin_left,
+        "low_right": x_fall - margin_right,
+        "high_right": x_fall + margin_right
+    }
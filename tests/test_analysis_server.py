@@ -0,0 +1,99 @@
+import json
+import os
+import socket
+import socketserver
+import threading
+import pytest
+import scan_cache
+from analysis_server import AnalysisService, RequestHandler, LRUCache
+
+SCAN = {"vth": [300, 301, 302], "hits": [1, 2, 0], "toa": [[10.], [11., 12.], []], "tot": [[2.], [3., 4.], []]}
+
+@pytest.fixture
+def scan_file(tmp_path):
+    directory = tmp_path / "outputs" / "43" / "2024-01-01-00-00-00"
+    directory.mkdir(parents=True)
+    path = directory / "Qinj_scan_ETROC_0_L1A_501_5.json"
+    path.write_text(json.dumps(SCAN))
+    return str(path)
+
+def test_lru_cache():
+    cache = LRUCache(2)
+    for key in ("a", "b", "a", "c"):
+        cache.get(key, lambda: key.upper())
+    assert list(cache.items) == ["a", "c"]
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 3
+    assert cache.get("none", lambda: None) is None and "none" not in cache.items
+
+def test_run_reads_scans_through_cache(tmp_path, scan_file):
+    cache_dir = str(tmp_path / "cache")
+    script = tmp_path / "script.py"
+    script.write_text(
+        "import sys\n"
+        "from scan_cache import load_scan\n"
+        "scan = load_scan(sys.argv[1], sys.argv[2])\n"
+        "print(int(scan['hits'].sum()))\n"
+    )
+    service = AnalysisService(cache_dir=cache_dir)
+    request = {"job": "run", "script": str(script), "args": [scan_file, cache_dir], "cwd": str(tmp_path)}
+    for _ in range(3):
+        answer = service.handle(request)
+        assert answer["ok"], answer.get("error")
+        assert answer["output"] == "3\n"
+    assert service.scans.stats()["misses"] == 1 and service.scans.stats()["hits"] == 2
+    # The loaders are restored after the job
+    assert scan_cache.load_scan.__module__ == "scan_cache"
+
+def test_run_cache_follows_file_changes(tmp_path, scan_file):
+    cache_dir = str(tmp_path / "cache")
+    service = AnalysisService(cache_dir=cache_dir)
+    assert list(service.load_scan(scan_file, cache_dir)["hits"]) == [1, 2, 0]
+    with open(scan_file, 'w') as f:
+        json.dump(dict(SCAN, hits=[4, 5, 6, 7][:3]), f)
+    stat = os.stat(scan_file)
+    os.utime(scan_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert list(service.load_scan(scan_file, cache_dir)["hits"]) == [4, 5, 6]
+
+def test_unknown_job():
+    answer = AnalysisService().handle({"job": "nothing"})
+    assert not answer["ok"] and "Unknown job" in answer["error"]
+
+# Sends raw bytes to a server handling one connection and returns the decoded answer
+def exchange(tmp_path, data: bytes):
+    socket_path = str(tmp_path / "test.sock")
+    with socketserver.UnixStreamServer(socket_path, RequestHandler) as server:
+        server.service = AnalysisService(cache_dir=str(tmp_path / "cache"))
+        server.running = True
+        thread = threading.Thread(target=server.handle_request)
+        thread.start()
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.settimeout(10.)
+            client.connect(socket_path)
+            client.sendall(data)
+            with client.makefile('r') as answer:
+                line = answer.readline()
+        thread.join()
+    return json.loads(line)
+
+@pytest.mark.parametrize("data", [b"not json\n", b"[1, 2]\n", b"\xff\xfe\n"])
+def test_malformed_request_gets_an_answer(tmp_path, capsys, data):
+    answer = exchange(tmp_path, data)
+    assert answer["ok"] is False
+    assert answer["error"].startswith("Malformed request")
+
+def test_request_over_socket(tmp_path, capsys):
+    answer = exchange(tmp_path, json.dumps({"job": "stats"}).encode() + b"\n")
+    assert answer["ok"] and set(answer["result"]) == {"trees", "scans", "fits"}
+
+def test_read_results_cached_per_columns(tmp_path):
+    pytest.importorskip("uproot")
+    import numpy as np
+    from results_io import write_results
+    file_name = str(tmp_path / "results_mod43.root")
+    write_results(file_name, {"charge": np.array([5, 10]), "width": np.array([1.5, 2.5])}, backend="uproot")
+    service = AnalysisService()
+    full = service.read_results(file_name)
+    assert list(full["width"]) == [1.5, 2.5]
+    assert set(service.read_results(file_name, columns=("charge",))) == {"charge"}
+    assert service.read_results(file_name) is full
+    assert service.trees.stats()["misses"] == 2 and service.trees.stats()["hits"] == 1
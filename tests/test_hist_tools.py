@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+ROOT = pytest.importorskip("ROOT")
+from hist_tools import fill_th1, fill_th2, th2_view
+
+# Random (x, y) pairs, some of them outside the axes to fill under/overflow
+def random_points(n: int = 5000, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    return rng.uniform(-10., 110., n), rng.uniform(-10., 210., n), rng.uniform(0.5, 2., n)
+
+def new_th2(name: str):
+    hist = ROOT.TH2D(name, name, 50, 0., 100., 40, 0., 200.)
+    hist.SetDirectory(ROOT.nullptr)
+    return hist
+
+def test_fill_th1_matches_fill():
+    x, _, w = random_points()
+    reference = ROOT.TH1D("ref_th1", "", 50, 0., 100.)
+    filled = ROOT.TH1D("fill_th1", "", 50, 0., 100.)
+    for xi, wi in zip(x, w):
+        reference.Fill(xi, wi)
+    fill_th1(filled, x, w)
+    for b in range(reference.GetNbinsX() + 2):
+        assert filled.GetBinContent(b) == pytest.approx(reference.GetBinContent(b))
+    assert filled.GetEntries() == reference.GetEntries()
+
+def test_fill_th2_matches_fill():
+    x, y, w = random_points()
+    reference = new_th2("ref_th2")
+    filled = new_th2("fill_th2")
+    for xi, yi, wi in zip(x, y, w):
+        reference.Fill(xi, yi, wi)
+    fill_th2(filled, x, y, w)
+    np.testing.assert_allclose(th2_view(filled), th2_view(reference))
+    assert filled.GetEntries() == reference.GetEntries()
+    assert filled.GetMean(2) == pytest.approx(reference.GetMean(2))
+
+def test_th2_view_indexing_and_write_back():
+    hist = new_th2("view_th2")
+    fill_th2(hist, np.array([15.]), np.array([105.]))
+    view = th2_view(hist)
+    assert view.shape == (hist.GetNbinsY() + 2, hist.GetNbinsX() + 2)
+    x_bin = hist.GetXaxis().FindBin(15.)
+    y_bin = hist.GetYaxis().FindBin(105.)
+    assert view[y_bin, x_bin] == 1.
+    assert view.sum() == 1.
+
+    view[y_bin, x_bin] = 7.
+    assert hist.GetBinContent(x_bin, y_bin) == 7.
+    hist.SetBinContent(1, 2, 3.)
+    assert view[2, 1] == 3.
+
+def test_fill_th2_length_mismatch():
+    with pytest.raises(ValueError):
+        fill_th2(new_th2("bad_th2"), np.zeros(3), np.zeros(4))
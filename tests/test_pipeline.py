@@ -0,0 +1,122 @@
+import ast
+import json
+import os
+import shlex
+import sys
+import warnings
+from glob import glob
+import pytest
+from pipeline import load_stages, topological_order, select_stages, stage_signature, Pipeline
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def stage(name: str, inputs: list, deps: list = (), command: str = None):
+    return {"name": name, "command": command or f"{shlex.quote(sys.executable)} -c pass", "cwd": ".", "deps": list(deps), "inputs": inputs}
+
+# Local modules imported anywhere in a script (imports inside functions included), followed recursively
+def local_imports(script: str):
+    directory = os.path.dirname(script)
+    found = set()
+    pending = [script]
+    while pending:
+        with open(pending.pop(), 'r') as f, warnings.catch_warnings():
+            # Some scripts have invalid escape sequences in their LaTeX labels
+            warnings.simplefilter("ignore", SyntaxWarning)
+            tree = ast.parse(f.read())
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                names = [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom) and node.level == 0:
+                names = [node.module]
+            else:
+                continue
+            for name in names:
+                path = os.path.join(directory, name.split('.')[0] + ".py")
+                if os.path.isfile(path) and path not in found:
+                    found.add(path)
+                    pending.append(path)
+    return found
+
+def test_load_stages_expands_matrix_and_patterns():
+    config = {"stages": [
+        {"name": "fit", "command": "fit"},
+        {"name": "run_{sens}", "command": "run --sens {sens}", "matrix": {"sens": ["A", "B"]}, "deps": ["fit"], "inputs": ["{sens}/*.json"]},
+        {"name": "draw", "command": "draw", "deps": ["run_*"]}
+    ]}
+    stages = load_stages(config)
+    assert stages["run_B"]["command"] == "run --sens B"
+    assert stages["run_B"]["inputs"] == ["B/*.json"]
+    assert stages["draw"]["deps"] == ["run_A", "run_B"]
+    order = topological_order(stages)
+    assert order.index("fit") < order.index("run_A") < order.index("draw")
+    assert set(select_stages(stages, ["run_A"])) == {"fit", "run_A"}
+
+def test_dependency_cycle():
+    stages = {"a": stage("a", [], ["b"]), "b": stage("b", [], ["a"])}
+    with pytest.raises(ValueError):
+        topological_order(stages)
+
+def test_signature_follows_inputs(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "data").mkdir()
+    (tmp_path / "data" / "scan.json").write_text("[1]")
+    (tmp_path / "script.py").write_text("pass")
+    fit = stage("fit", ["script.py", "data/**/*.json"])
+    first = stage_signature(fit, [])
+    assert stage_signature(fit, []) == first
+
+    # A rewrite of a listed input, a new matching file and a new dependency signature all change it
+    stat = os.stat("script.py")
+    os.utime("script.py", ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    second = stage_signature(fit, [])
+    assert second != first
+    (tmp_path / "data" / "sub").mkdir()
+    (tmp_path / "data" / "sub" / "new.json").write_text("[2]")
+    third = stage_signature(fit, [])
+    assert third != second
+    assert stage_signature(fit, ["upstream"]) != third
+
+    # Files that are not listed do not count
+    (tmp_path / "unlisted.py").write_text("pass")
+    assert stage_signature(fit, []) == third
+
+def test_change_propagates_downstream(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    for name in ("fit.py", "plot.py", "other.py"):
+        (tmp_path / name).write_text("pass")
+    stages = {
+        "fit": stage("fit", ["fit.py"]),
+        "plot": stage("plot", ["plot.py"], ["fit"]),
+        "other": stage("other", ["other.py"])
+    }
+    cache_dir = str(tmp_path / "cache")
+    status = lambda report: {name: value[0] for name, value in report.items()}
+    assert status(Pipeline(stages, cache_dir).run()) == {"fit": "done", "plot": "done", "other": "done"}
+    assert set(status(Pipeline(stages, cache_dir).run()).values()) == {"up to date"}
+
+    stat = os.stat("fit.py")
+    os.utime("fit.py", ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert status(Pipeline(stages, cache_dir).run()) == {"fit": "done", "plot": "done", "other": "up to date"}
+
+def test_failure_blocks_downstream(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    stages = {
+        "fit": stage("fit", [], command=f"{shlex.quote(sys.executable)} -c 'raise SystemExit(1)'"),
+        "plot": stage("plot", [], ["fit"])
+    }
+    report = Pipeline(stages, str(tmp_path / "cache")).run()
+    assert report["fit"][0] == "failed" and report["plot"][0] == "blocked"
+
+# A module imported by a stage but missing from its inputs can change without the stage running again
+def test_stage_inputs_cover_imported_modules(monkeypatch):
+    monkeypatch.chdir(REPO_DIR)
+    with open("pipeline.json", 'r') as f:
+        stages = load_stages(json.load(f))
+    for name, config in stages.items():
+        scripts = [arg for arg in shlex.split(config["command"]) if arg.endswith(".py")]
+        assert scripts, f"No script in the command of stage {name}"
+        listed = {os.path.normpath(path) for pattern in config["inputs"] for path in glob(pattern, recursive=True)}
+        for script in scripts:
+            script = os.path.normpath(os.path.join(config["cwd"], script))
+            needed = {script} | {os.path.normpath(path) for path in local_imports(script)}
+            assert not needed - listed, f"Stage {name} does not list {sorted(needed - listed)} in its inputs"
@@ -0,0 +1,55 @@
+import json
+import os
+import numpy as np
+import pytest
+from qinj_engine import fit_windows, curve_limits, pick_limit, previous_charge_seeds
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Limits of read_outputs_qinj_HPK_unirr_RT.py, the script replaced by the HPK_unirr_RT_lightoff series
+LOW_LEFT, HIGH_LEFT = 62, 68
+LOW_RIGHT, HIGH_RIGHT = [70., 75., 83., 100., 105.], [87., 100., 112., 125., 140.]
+LOW_LEFT_0V, HIGH_LEFT_0V = [65., 65., 65, 65, 65], [75., 77., 83., 83., 83.]
+LOW_RIGHT_0V, HIGH_RIGHT_0V = [74., 75., 77., 78., 85.], [87., 100., 112., 95., 105.]
+CHARGES = [5., 10., 15., 20., 25.]
+
+@pytest.fixture(scope="module")
+def hpk_windows():
+    with open(os.path.join(REPO_DIR, "qinj_series.json"), 'r') as f:
+        config = json.load(f)
+    return next(series for series in config["series"] if series.get("name") == "HPK_unirr_RT_lightoff")["windows"]
+
+def test_pick_limit():
+    assert pick_limit(3, 1, 2) == 3.
+    assert pick_limit([1, 2, 3], 0, 2) == 3.
+    assert pick_limit([[1, 2], [3, 4]], 1, 0) == 3.
+
+@pytest.mark.parametrize("i", range(5))
+def test_override_changes_ranges_not_seeds(hpk_windows, i):
+    # At 0 V the script fitted on the 0V limits but started both edges from the default limits
+    low_left, high_left, low_right, high_right, seed_left, seed_right = fit_windows(hpk_windows, 0, i, CHARGES[i], 0)
+    assert (low_left, high_left) == (LOW_LEFT_0V[i], HIGH_LEFT_0V[i])
+    assert (low_right, high_right) == (LOW_RIGHT_0V[i], HIGH_RIGHT_0V[i])
+    assert seed_left == (LOW_LEFT + HIGH_LEFT) / 2.
+    assert seed_right == (LOW_RIGHT[i] + HIGH_RIGHT[i]) / 2.
+
+@pytest.mark.parametrize("i", range(5))
+def test_default_windows(hpk_windows, i):
+    low_left, high_left, low_right, high_right, seed_left, seed_right = fit_windows(hpk_windows, 0, i, CHARGES[i], 50)
+    assert (low_left, high_left) == (LOW_LEFT, HIGH_LEFT + CHARGES[i] * 1.25)
+    assert (low_right, high_right) == (LOW_RIGHT[i], HIGH_RIGHT[i])
+    assert seed_right == (low_right + high_right) / 2.
+
+def test_single_charge_override(hpk_windows):
+    limits = fit_windows(hpk_windows, 0, 4, 25., 100)
+    assert limits[:2] == (65., 85.)
+    assert limits[4] == (LOW_LEFT + HIGH_LEFT) / 2.
+    assert fit_windows(hpk_windows, 0, 3, 20., 100)[:2] == (LOW_LEFT, HIGH_LEFT + 20. * 1.25)
+
+def test_curve_limits_columns(hpk_windows):
+    limits = curve_limits(hpk_windows, 0, list(range(5)), CHARGES, 0, [], [])
+    assert limits.shape == (5, 6)
+    np.testing.assert_array_equal(limits[:, 5], (np.array(LOW_RIGHT) + HIGH_RIGHT) / 2.)
+
+def test_previous_charge_seeds():
+    assert previous_charge_seeds(["a", "a", "a", "b", "b"]) == [-1, 0, 1, -1, 3]
@@ -0,0 +1,86 @@
+import math
+import numpy as np
+import pytest
+from ragged import Ragged, GroupedStats, ragged_stats
+
+# Per-Vth mean and standard deviation as computed by eval_list() in toatot_root.py before the Ragged container
+def eval_list(data, datavth):
+    mean = []
+    devstd = []
+    vth = []
+    for i, sublist in enumerate(data):
+        if len(sublist)>0:
+            mean.append(sum(sublist)/len(sublist))
+            std = 0
+            vth.append(datavth[i])
+            for item in sublist:
+                std += ((item-mean[-1])**2)/len(sublist)
+            devstd.append(math.sqrt(std))
+    return mean, devstd, vth
+
+# Random hit lists with some empty Vth steps, at the start, in the middle and at the end
+def random_scan(seed: int = 0, n_vth: int = 40):
+    rng = np.random.default_rng(seed)
+    lengths = rng.integers(0, 30, n_vth)
+    lengths[[0, 7, 8, n_vth - 1]] = 0
+    vth = np.arange(300, 300 + n_vth)
+    toa = [list(rng.normal(150., 20., n)) for n in lengths]
+    tot = [list(rng.normal(60., 5., n)) for n in lengths]
+    return vth, toa, tot
+
+def test_matches_eval_list():
+    vth, toa, _ = random_scan()
+    mean, std, count, vth_filled = ragged_stats(Ragged.from_nested(toa, vth))
+    ref_mean, ref_std, ref_vth = eval_list(toa, vth)
+    np.testing.assert_allclose(mean[0], ref_mean, rtol=1e-12)
+    np.testing.assert_allclose(std[0], ref_std, rtol=1e-9, atol=1e-12)
+    np.testing.assert_array_equal(vth_filled, ref_vth)
+    np.testing.assert_array_equal(count, [len(sublist) for sublist in toa if sublist])
+
+def test_two_quantities_in_one_pass():
+    vth, toa, tot = random_scan(1)
+    mean, std, _, _ = ragged_stats(Ragged.from_nested(toa, vth), Ragged.from_nested(tot, vth))
+    for k, data in enumerate((toa, tot)):
+        ref_mean, ref_std, _ = eval_list(data, vth)
+        np.testing.assert_allclose(mean[k], ref_mean, rtol=1e-12)
+        np.testing.assert_allclose(std[k], ref_std, rtol=1e-9, atol=1e-12)
+
+def test_single_hit_has_zero_std():
+    mean, std, count, vth = ragged_stats(Ragged.from_nested([[], [5.], []], np.array([1, 2, 3])))
+    np.testing.assert_array_equal(mean[0], [5.])
+    np.testing.assert_array_equal(std[0], [0.])
+    np.testing.assert_array_equal(vth, [2])
+
+def test_all_thresholds_empty():
+    mean, std, count, vth = ragged_stats(Ragged.from_nested([[], [], []], np.array([1, 2, 3])))
+    assert mean.shape == (1, 0) and std.shape == (1, 0)
+    assert len(count) == 0 and len(vth) == 0
+    assert eval_list([[], [], []], [1, 2, 3]) == ([], [], [])
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 17, 100, 10**6])
+def test_chunked_matches_single_pass(chunk_size):
+    vth, toa, tot = random_scan(2)
+    hits = (Ragged.from_nested(toa, vth), Ragged.from_nested(tot, vth))
+    full = ragged_stats(*hits)
+    chunked = ragged_stats(*hits, chunk_size=chunk_size)
+    for a, b in zip(full, chunked):
+        np.testing.assert_allclose(a, b, rtol=1e-10, atol=1e-10)
+
+def test_merge_of_separate_accumulations():
+    vth, toa, _ = random_scan(3)
+    # Every Vth step gets hits from both parts
+    first = [sublist[:len(sublist) // 2] for sublist in toa]
+    second = [sublist[len(sublist) // 2:] for sublist in toa]
+    stats = GroupedStats(vth)
+    for part in (first, second):
+        ragged = Ragged.from_nested(part, vth)
+        stats.merge(GroupedStats(vth).update(ragged.group, ragged.values))
+    mean, std, _, _ = stats.result()
+    ref_mean, ref_std, _ = eval_list(toa, vth)
+    np.testing.assert_allclose(mean[0], ref_mean, rtol=1e-12)
+    np.testing.assert_allclose(std[0], ref_std, rtol=1e-9, atol=1e-12)
+
+def test_different_layouts_rejected():
+    vth = np.array([1, 2])
+    with pytest.raises(ValueError):
+        ragged_stats(Ragged.from_nested([[1.], [2.]], vth), Ragged.from_nested([[1., 2.], []], vth))
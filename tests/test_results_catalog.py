@@ -0,0 +1,75 @@
+import os
+from results_catalog import ResultsCatalog, parse_metadata
+
+QINJ_FILE = os.path.join("FBK_2e14", "results_mod43_-20C.root")
+TOA_FILE = os.path.join("FBK_2e14", "toa_tot", "2024-01-01-10-00-00_200V.root")
+
+def touch(root, relpath: str, content: bytes = b"x"):
+    path = os.path.join(str(root), relpath)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(content)
+    return path
+
+# Moves the mtime of a file forward, as a rewrite in place would
+def bump_mtime(path: str, seconds: int = 10):
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + seconds * 10**9))
+
+def test_parse_metadata():
+    meta = parse_metadata(QINJ_FILE)
+    assert (meta["kind"], meta["vendor"], meta["module"], meta["dose"], meta["temperature"]) == ("qinj", "FBK", 43, 2, -20)
+    meta = parse_metadata(TOA_FILE)
+    assert (meta["kind"], meta["timestamp"], meta["voltage"]) == ("toa_tot", "2024-01-01-10-00-00", "200V")
+
+def test_first_update_and_no_change(tmp_path):
+    touch(tmp_path, QINJ_FILE)
+    touch(tmp_path, TOA_FILE)
+    touch(tmp_path, "top_level.root")
+    with ResultsCatalog(str(tmp_path)) as catalog:
+        assert catalog.update() == (2, 0, 0)
+        assert catalog.update() == (0, 0, 0)
+        assert [os.path.relpath(path, str(tmp_path)) for path in catalog.paths(kind="qinj")] == [QINJ_FILE]
+
+def test_refresh_after_mtime_change(tmp_path):
+    path = touch(tmp_path, QINJ_FILE)
+    with ResultsCatalog(str(tmp_path)) as catalog:
+        catalog.update()
+        old_mtime = catalog.records()[0]["mtime_ns"]
+
+        # Same size, same directory entries: only the mtime of the file tells it was rewritten
+        bump_mtime(path)
+        assert catalog.update() == (0, 1, 0)
+        assert catalog.records()[0]["mtime_ns"] == os.stat(path).st_mtime_ns != old_mtime
+        assert catalog.update() == (0, 0, 0)
+
+def test_refresh_persists_across_connections(tmp_path):
+    path = touch(tmp_path, QINJ_FILE)
+    with ResultsCatalog(str(tmp_path)) as catalog:
+        catalog.update()
+    bump_mtime(path)
+    with ResultsCatalog(str(tmp_path)) as catalog:
+        assert catalog.update() == (0, 1, 0)
+
+def test_added_and_removed_files(tmp_path):
+    qinj = touch(tmp_path, QINJ_FILE)
+    with ResultsCatalog(str(tmp_path)) as catalog:
+        catalog.update()
+        touch(tmp_path, TOA_FILE)
+        assert catalog.update() == (1, 0, 0)
+        os.remove(qinj)
+        assert catalog.update() == (0, 0, 1)
+        assert catalog.paths(kind="qinj") == []
+        assert len(catalog.paths(kind="toa_tot")) == 1
+
+def test_removed_file_with_unchanged_directory_mtime(tmp_path):
+    qinj = touch(tmp_path, QINJ_FILE)
+    directory = os.path.dirname(qinj)
+    with ResultsCatalog(str(tmp_path)) as catalog:
+        catalog.update()
+        stat = os.stat(directory)
+        os.remove(qinj)
+        # Within the timestamp resolution the directory keeps its mtime, the file must still be dropped
+        os.utime(directory, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        assert catalog.update() == (0, 0, 1)
+        assert catalog.paths() == []
@@ -0,0 +1,68 @@
+import gc
+import importlib.util
+import pytest
+from root_output import RootOutput, parse_compression
+
+needs_root = pytest.mark.skipif(importlib.util.find_spec("ROOT") is None, reason="PyROOT is not installed")
+
+def test_parse_compression():
+    assert parse_compression("zstd:5") == 505
+    assert parse_compression("lzma:9") == 209
+    assert parse_compression("zlib") == 105
+    assert parse_compression("none") == 0
+    with pytest.raises(ValueError):
+        parse_compression("gzip:5")
+    with pytest.raises(ValueError):
+        parse_compression("zstd:12")
+
+# Gaussian histogram fitted with the 'S' option, as in toatot_root.py
+def fitted_hist(ROOT, name: str, mean: float):
+    hist = ROOT.TH1D(name, name, 100, mean - 50., mean + 50.)
+    hist.SetDirectory(ROOT.nullptr)
+    function = ROOT.TF1(f"{name}_func", "gaus", mean - 50., mean + 50.)
+    function.SetParameters(1000., mean, 10.)
+    hist.FillRandom(f"{name}_func", 20000)
+    return hist, hist.Fit("gaus", "QSR0")
+
+@needs_root
+def test_fit_result_outlives_its_pointer(tmp_path):
+    import ROOT
+    ROOT.gRandom.SetSeed(1)
+    path = str(tmp_path / "fits.root")
+    output = RootOutput(path)
+    expected = {}
+    for charge, mean in ((10, 120.), (20, 150.)):
+        # As in the scripts, the TFitResultPtr is overwritten by the next fit before write()
+        hist, fit_result = fitted_hist(ROOT, f"toa_distrib_{charge}", mean)
+        expected[charge] = [fit_result.Parameter(k) for k in range(3)]
+        output.add(fit_result, f"fit_c{charge}")
+        output.add(hist, f"toa_distrib_{charge}")
+    del fit_result, hist
+    gc.collect()
+    output.write()
+
+    infile = ROOT.TFile.Open(path, "READ")
+    for charge, params in expected.items():
+        saved = infile.Get(f"fit_c{charge}")
+        assert saved.NPar() == 3
+        assert [saved.Parameter(k) for k in range(3)] == pytest.approx(params)
+        assert infile.Get(f"toa_distrib_{charge}").GetEntries() == 20000
+    infile.Close()
+
+@needs_root
+def test_update_keeps_other_objects(tmp_path):
+    import ROOT
+    path = str(tmp_path / "update.root")
+    with RootOutput(path) as output:
+        output.add(fitted_hist(ROOT, "first", 100.)[0], "first")
+        output.add(fitted_hist(ROOT, "second", 100.)[0], "second")
+    replacement = ROOT.TH1D("second_new", "", 10, 0., 1.)
+    with RootOutput(path, update=True) as output:
+        output.add(replacement, "second")
+
+    infile = ROOT.TFile.Open(path, "READ")
+    assert sorted(key.GetName() for key in infile.GetListOfKeys()) == ["first", "second"]
+    assert all(key.GetCycle() == 1 for key in infile.GetListOfKeys())
+    assert infile.Get("first").GetEntries() == 20000
+    assert infile.Get("second").GetNbinsX() == 10
+    infile.Close()
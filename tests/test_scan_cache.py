@@ -0,0 +1,54 @@
+import json
+import os
+import numpy as np
+import scan_cache
+
+SCAN = {
+    "vth": [300, 301, 302, 303],
+    "hits": [0, 2, 0, 3],
+    "toa": [[], [10.5, 11.], [], [12., 12.5, 13.]],
+    "tot": [[], [2., 3.], [], [4., 5., 6.]],
+}
+
+# Writes a Qinj_scan json below module_test/outputs/<module>/<timestamp>/
+def write_scan(tmp_path, scan: dict = SCAN):
+    directory = tmp_path / "module_test" / "outputs" / "mod43" / "2024-01-01-00-00-00"
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / "Qinj_scan_10.json"
+    path.write_text(json.dumps(scan))
+    return str(path)
+
+def test_cache_path_keeps_module_timestamp_file(tmp_path):
+    path = write_scan(tmp_path)
+    target = scan_cache.cache_path(path, str(tmp_path / "cache"))
+    assert target == os.path.join(str(tmp_path / "cache"), "mod43", "2024-01-01-00-00-00", "Qinj_scan_10")
+
+def test_round_trip(tmp_path):
+    path = write_scan(tmp_path)
+    scan = scan_cache.load_scan(path, str(tmp_path / "cache"))
+    np.testing.assert_array_equal(scan["vth"], SCAN["vth"])
+    np.testing.assert_array_equal(scan["hits"], SCAN["hits"])
+    for key in scan_cache.RAGGED_KEYS:
+        values, offsets = scan[f"{key}_values"], scan[f"{key}_offsets"]
+        assert len(offsets) == len(SCAN[key]) + 1
+        for i, sublist in enumerate(SCAN[key]):
+            np.testing.assert_array_equal(values[offsets[i]:offsets[i + 1]], sublist)
+
+def test_all_empty_lists(tmp_path):
+    path = write_scan(tmp_path, dict(SCAN, toa=[[], [], [], []], tot=[[], [], [], []]))
+    scan = scan_cache.load_scan(path, str(tmp_path / "cache"))
+    assert len(scan["toa_values"]) == 0
+    np.testing.assert_array_equal(scan["toa_offsets"], [0, 0, 0, 0, 0])
+
+def test_stale_entry_is_converted_again(tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    path = write_scan(tmp_path)
+    assert scan_cache.convert_if_stale(path, cache_dir)
+    assert not scan_cache.convert_if_stale(path, cache_dir)
+
+    write_scan(tmp_path, dict(SCAN, hits=[1, 2, 3, 4]))
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    scan = scan_cache.load_scan(path, cache_dir)
+    np.testing.assert_array_equal(scan["hits"], [1, 2, 3, 4])
+    assert not scan_cache.convert_if_stale(path, cache_dir)
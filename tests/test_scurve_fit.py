@@ -0,0 +1,125 @@
+import numpy as np
+import pytest
+from scipy.special import erf, erfc
+from scurve_fit import (MODELS, SQRT_2LN2, batch_least_squares, edge_position, fit_edges, fit_edges_warm, initial_params,
+                        stack_curves, warm_start, window_mask)
+
+VTH = np.arange(0., 120., 1.)
+
+# Known parameters of each model, one row per curve
+TRUE_PARAMS = {
+    "erf": np.array([[30., 3., 50., 50.], [35.5, 2., 40., 40.], [28., 5., 60., 60.]]),
+    "erfc": np.array([[80., 4., 50., 0.], [75.2, 2.5, 40., 0.], [85., 6., 30., 0.]]),
+    "gaus": np.array([[100., 40., 6.], [80., 45.5, 4.], [120., 38., 8.]])
+}
+WINDOWS = {"erf": (10., 55.), "erfc": (60., 110.), "gaus": (10., 75.)}
+
+# Noise-free S curves: erf rising edge, plateau, erfc falling edge, for edges moving with the charge
+def s_curves(left: np.array, right: np.array, sigma_left: float = 3., sigma_right: float = 4., height: float = 100.):
+    x = VTH[None, :]
+    rise = height / 2 * erf((x - left[:, None]) / sigma_left) + height / 2
+    fall = height / 2 * erfc((x - right[:, None]) / sigma_right)
+    return np.broadcast_to(VTH, (len(left), len(VTH))).copy(), np.minimum(rise, fall)
+
+@pytest.mark.parametrize("model", ["erf", "erfc", "gaus"])
+def test_recovers_known_parameters(model):
+    true = TRUE_PARAMS[model]
+    vth = np.broadcast_to(VTH, (len(true), len(VTH))).copy()
+    hits, _ = MODELS[model](vth, true)
+    low, high = WINDOWS[model]
+    mask = window_mask(vth, hits, low, high)
+    p0 = initial_params(model, vth, hits, mask, low, high)
+    params, chi2, ndf = batch_least_squares(model, vth, hits, mask, p0)
+    # The sign of the width is free in the models, compare its absolute value
+    width = {"erf": 1, "erfc": 1, "gaus": 2}[model]
+    params[:, width] = np.abs(params[:, width])
+    np.testing.assert_allclose(params, true, rtol=1e-6, atol=1e-6)
+    assert (chi2 < 1e-8).all()
+    np.testing.assert_array_equal(ndf, mask.sum(axis=1) - true.shape[1])
+
+def test_fit_edges_recovers_s_curves():
+    left, right = np.array([25., 30., 35.]), np.array([80., 82., 85.])
+    vth, hits = s_curves(left, right)
+    edges = fit_edges(vth, hits, 5., 55., 60., 110.)
+    np.testing.assert_allclose(edges["HM_left"], left, atol=1e-4)
+    np.testing.assert_allclose(edges["params_right"][:, 0], right, atol=1e-4)
+    np.testing.assert_allclose(edges["width"], right - left, atol=1e-4)
+    np.testing.assert_allclose(edges["sigma_left"], 3., atol=1e-4)
+    np.testing.assert_allclose(edges["sigma_right"], 4., atol=1e-4)
+
+def test_gaus_edge_is_half_maximum():
+    params = np.array([[10., 40., 5.]])
+    assert edge_position("gaus", params)[0] == pytest.approx(40. - 5. * SQRT_2LN2)
+    x = edge_position("gaus", params)
+    value, _ = MODELS["gaus"](x[:, None], params)
+    assert value[0, 0] == pytest.approx(5.)
+
+def test_warm_start_moves_edge_to_default():
+    default = np.array([[30., 10., 45., 45.], [32., 10., 45., 45.]])
+    seed = np.array([[20., 3., 50., 50.], [np.nan] * 4])
+    p0, usable = warm_start("erf", default, seed)
+    np.testing.assert_array_equal(usable, [True, False])
+    np.testing.assert_array_equal(p0[0], [30., 3., 50., 50.])
+    np.testing.assert_array_equal(p0[1], default[1])
+
+def test_gaus_warm_start_moves_half_maximum():
+    default = np.array([[90., 40., 10.]])
+    seed = np.array([[100., 30., 4.]])
+    p0, usable = warm_start("gaus", default, seed)
+    assert usable[0]
+    np.testing.assert_allclose(edge_position("gaus", p0), edge_position("gaus", default))
+    assert p0[0, 0] == 100. and p0[0, 2] == 4.
+
+# Gaus peaks moving with the charge, fitted cold and each seeded from the previous one
+def test_gaus_warm_and_cold_fits_agree():
+    true = np.stack([np.linspace(80., 120., 6), np.linspace(30., 50., 6), np.linspace(4., 7., 6)], axis=1)
+    vth = np.broadcast_to(VTH, (len(true), len(VTH))).copy()
+    hits, _ = MODELS["gaus"](vth, true)
+    cold = fit_edges_warm(vth, hits, 10., 75., 80., 110., left_model="gaus")
+    warm = fit_edges_warm(vth, hits, 10., 75., 80., 110., left_model="gaus", seed_from=[-1, 0, 1, 2, 3, 4])
+    for edges in (cold, warm):
+        np.testing.assert_allclose(edges["HM_left"], true[:, 1] - true[:, 2] * SQRT_2LN2, atol=1e-5)
+        np.testing.assert_allclose(edges["sigma_left"], true[:, 2], atol=1e-5)
+
+# Charges of two pixels: each curve is seeded from the previous charge of its pixel, with noise on the hits
+def charge_series(seed: int = 0):
+    rng = np.random.default_rng(seed)
+    # The cold fits of edges just below the window centre can collapse into a step (width -> 0), keep away from them
+    left = np.concatenate([np.linspace(44., 36., 4), np.linspace(29., 20., 4), np.linspace(46., 37., 4), np.linspace(28., 22., 4)])
+    right = np.concatenate([np.linspace(75., 90., 8), np.linspace(78., 88., 8)])
+    vth, hits = s_curves(left, right)
+    hits = hits + rng.normal(0., 0.5, hits.shape)
+    seed_from = np.array([-1] + list(range(7)) + [-1] + list(range(8, 15)))
+    return vth, hits, seed_from, left, right
+
+def test_warm_and_cold_fits_agree():
+    vth, hits, seed_from, left, right = charge_series()
+    cold = fit_edges_warm(vth, hits, 5., 60., 62., 110.)
+    warm = fit_edges_warm(vth, hits, 5., 60., 62., 110., seed_from=seed_from)
+    assert not cold["seeded"].any()
+    np.testing.assert_array_equal(warm["seeded"], seed_from >= 0)
+    for key in ("HM_left", "width", "sigma_left", "sigma_right", "chi2_left", "chi2_right"):
+        np.testing.assert_allclose(warm[key], cold[key], rtol=1e-5, atol=1e-5)
+    for edges in (cold, warm):
+        np.testing.assert_allclose(edges["HM_left"], left, atol=0.1)
+        np.testing.assert_allclose(edges["params_right"][:, 0], right, atol=0.1)
+
+def test_warm_same_as_fit_edges_without_seeds():
+    vth, hits, _, _, _ = charge_series(1)
+    cold = fit_edges(vth, hits, 5., 60., 62., 110.)
+    unseeded = fit_edges_warm(vth, hits, 5., 60., 62., 110.)
+    for key, value in cold.items():
+        np.testing.assert_array_equal(unseeded[key], value)
+
+def test_failed_seed_falls_back_to_defaults():
+    vth, hits, _, _, _ = charge_series(2)
+    # The first curve has no hits in its left window: its fit has no usable edge and must not seed the second one
+    hits[0, :61] = np.nan
+    warm = fit_edges_warm(vth[:2], hits[:2], 5., 60., 62., 110., seed_from=[-1, 0])
+    cold = fit_edges(vth[1:2], hits[1:2], 5., 60., 62., 110.)
+    assert warm["HM_left"][1] == pytest.approx(cold["HM_left"][0], abs=1e-5)
+
+def test_seed_must_come_first():
+    vth, hits = stack_curves([VTH, VTH], [np.zeros(len(VTH)), np.zeros(len(VTH))])
+    with pytest.raises(ValueError):
+        fit_edges_warm(vth, hits, 5., 60., 62., 110., seed_from=[1, -1])
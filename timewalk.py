@@ -0,0 +1,59 @@
+import json
+import os
+import numpy as np
+from re import search
+
+# Time-walk calibrations produced by ToA_ToT/fit_correction.py.
+# Each ToA_ToT/FBK_<fluence>/fit_<timestamp>_<voltage>.json holds, per charge, the pol2 parameters of ToA vs ToT;
+# the store reads them all once and indexes them by (fluence, timestamp, voltage, charge).
+
+# Applies one or more time-walk corrections toa - p1*tot - p2*tot^2 to flat ToA/ToT arrays.
+# parval is a single parameter list (returns one array) or a (n_calibrations, 3) table (returns one row per calibration)
+def correct_toa(toa: np.array, tot: np.array, parval):
+    parval = np.asarray(parval, dtype=np.float64)
+    toa = np.asarray(toa, dtype=np.float64)
+    tot = np.asarray(tot, dtype=np.float64)
+    if parval.ndim == 1:
+        return toa - (parval[1] + parval[2]*tot)*tot
+    return toa[None, :] - (parval[:, 1, None] + parval[:, 2, None]*tot[None, :])*tot[None, :]
+
+class CalibrationStore:
+    def __init__(self, base_dir: str = "ToA_ToT"):
+        self.params = {}
+        self.errors = {}
+        if os.path.isdir(base_dir):
+            self.load(base_dir)
+
+    # Reads every fit_<timestamp>_<voltage>.json found in the FBK_<fluence> directories
+    def load(self, base_dir: str):
+        for sensdir in sorted(os.listdir(base_dir)):
+            fluence_match = search(r'FBK_(\d+e\d+)', sensdir)
+            if not fluence_match or not os.path.isdir(os.path.join(base_dir, sensdir)):
+                continue
+            for file in sorted(os.listdir(os.path.join(base_dir, sensdir))):
+                file_match = search(r'^fit_(\d{4}(?:-\d{2}){5})_(\w+)\.json$', file)
+                if not file_match:
+                    continue
+                with open(os.path.join(base_dir, sensdir, file), 'r') as jfile:
+                    data = json.load(jfile)
+                for charge, fit in data.items():
+                    key = (fluence_match.group(1), file_match.group(1), file_match.group(2), int(charge))
+                    self.params[key] = np.asarray(fit['parval'], dtype=np.float64)
+                    self.errors[key] = np.asarray(fit['parerr'], dtype=np.float64)
+        return self
+
+    def __contains__(self, key: tuple):
+        return key in self.params
+
+    def __len__(self):
+        return len(self.params)
+
+    # Parameters of a calibration, key being (fluence, timestamp, voltage, charge)
+    def get(self, fluence: str, timestamp: str, voltage: str, charge: int):
+        return self.params[(fluence, timestamp, voltage, int(charge))]
+
+    # Corrects the ToA with the calibration of one key, or with several keys at once (one output row per key)
+    def correct(self, toa: np.array, tot: np.array, *keys: tuple):
+        if len(keys) == 1:
+            return correct_toa(toa, tot, self.get(*keys[0]))
+        return correct_toa(toa, tot, np.stack([self.get(*key) for key in keys]))
@@ -0,0 +1,99 @@
+import ROOT
+import numpy as np
+from hist_tools import clean_toa_tot, profile_x, fit_pol2
+from fit_models import get_model
+
+# Time walk fit of a ToA vs ToT histogram: noise cleaning, profile along ToT and pol2 fit from the profile minimum.
+# Used by ToA_ToT/fit_correction.py on the saved histograms and by toatot_fused.py on the histograms in memory.
+
+# Fit range in ToT of the time walk
+FIT_LOW = 0.
+FIT_HIGH = 160.
+
+# Noise cuts of the ToA vs ToT histograms for each module, see hist_tools.clean_toa_tot
+CLEAN_CUTS = {
+    43: {'y_high': 250., 'band_low': 0.5, 'band_high': 1.2},
+    'default': {'y_high': 350., 'band_low': 0.5, 'band_high': 1.2}
+}
+
+# Find minimum on X axis
+def get_minval(profile: ROOT.TH1, x_low: float, x_high: float):
+    bin_low = profile.GetXaxis().FindBin(x_low)
+    bin_high = profile.GetXaxis().FindBin(x_high)
+
+    min_value = float('inf')
+    min_bin = -1
+
+    for bin in range(bin_low,bin_high+1):
+        bin_cont = profile.GetBinContent(bin)
+        if bin_cont < min_value:
+            min_value = bin_cont
+            min_bin = bin
+    minval = profile.GetXaxis().GetBinLowEdge(min_bin)
+    return minval
+
+# Delete noise bins
+def clean_hist(hist2d: ROOT.TH2, module: int):
+    cuts = CLEAN_CUTS.get(module, CLEAN_CUTS['default'])
+    clean_toa_tot(hist2d, **cuts)
+
+# Fit results as saved in the fit_<timestamp>_<voltage>.json files, zeros when the fit failed
+def empty_fit():
+    return {
+        'parname': [0, 0, 0],
+        'parval': [0, 0, 0],
+        'parerr': [0, 0, 0],
+        'Chi2': 0,
+        'NDF': 0,
+    }
+
+# Fast time walk fit: profile from the bin contents, start point at the profile minimum and closed-form pol2 fit
+# Returns the same dictionary saved in fit_<file>.json by the Minuit fit
+def fit_profile_pol2(hist2d: ROOT.TH2D, x_low: float, x_high: float):
+    x_centers, mean, error, sumw = profile_x(hist2d)
+    first = hist2d.GetXaxis().FindBin(x_low) - 1
+    last = hist2d.GetXaxis().FindBin(x_high) - 1
+    first = max(first, 0)
+    start = first + int(np.argmin(mean[first:last+1]))
+    parval, parerr, chi2, ndf = fit_pol2(x_centers[start:last+1], mean[start:last+1], error[start:last+1])
+    return {
+        'parname': ['a0', 'a1', 'a2'],
+        'parval': [float(par) for par in parval],
+        'parerr': [float(err) for err in parerr],
+        'Chi2': chi2,
+        'NDF': ndf,
+    }
+
+# Minuit time walk fit of the profile from its minimum, returns the json dictionary and the TFitResult (None if it failed)
+def fit_profile_minuit(profile: ROOT.TProfile, charge: int, x_low: float, x_high: float):
+    minval = get_minval(profile, x_low, x_high)
+    fitfunc = get_model("pol2", minval, x_high, f'fitfunc_{charge}')
+    fit_result = profile.Fit(fitfunc,'RS')
+    try:
+        npar = fit_result.NPar()
+        fit = {
+            'parname': [fit_result.GetParameterName(iter) for iter in range(npar)],
+            'parval': [fit_result.Parameter(iter) for iter in range(npar)],
+            'parerr': [fit_result.ParError(iter) for iter in range(npar)],
+            'Chi2': fit_result.Chi2(),
+            'NDF': fit_result.Ndf(),
+        }
+    except:
+        print("Cannot save fit results")
+        return empty_fit(), None
+    return fit, fit_result
+
+# Cleans a ToA vs ToT histogram in place and fits its time walk.
+# Returns the json dictionary of the fit, the profile and the TFitResult (None with fast or if the fit failed)
+def fit_timewalk(hist2d: ROOT.TH2D, charge: int, module: int, fast: bool = False):
+    clean_hist(hist2d, module)
+    profile = hist2d.ProfileX(f"toa_tot_{charge}_prof")
+    profile.GetYaxis().SetTitle("ToA mean (a.u.)")
+    if fast:
+        try:
+            return fit_profile_pol2(hist2d, FIT_LOW, FIT_HIGH), profile, None
+        except (np.linalg.LinAlgError, ValueError):
+            print("Cannot save fit results")
+            return empty_fit(), profile, None
+    fit, fit_result = fit_profile_minuit(profile, charge, FIT_LOW, FIT_HIGH)
+    return fit, profile, fit_result
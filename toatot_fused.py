@@ -0,0 +1,235 @@
+import json
+import os
+import time
+import argparse
+import ROOT
+import numpy as np
+from datetime import datetime
+import matplotlib.pyplot as plt
+from scan_cache import load_scan
+from ragged import Ragged, ragged_stats
+from timewalk import correct_toa
+from timewalk_fit import fit_timewalk
+from fit_models import get_model
+from hist_tools import fill_th2
+from results_io import read_results
+from results_catalog import find_root_files
+from run_index import RunIndex
+from root_output import RootOutput, DEFAULT_COMPRESSION
+from toatot_root import SENSORS, decode_toa, decode_tot
+
+# Single pass ToA/ToT analysis of one sensor, replacing the chain
+#   toatot_root.py --no_correct -> ToA_ToT/fit_correction.py -> toatot_root.py -> ToA_ToT/distrib_toa.py
+# Every scan is decoded once: the ToA vs ToT histogram is cleaned and its time walk fitted in memory, the fit
+# corrects the ToA of the same hits and the corrected ToA distributions are fitted right away.
+# Each ToA_ToT/FBK_<fluence>/<timestamp>_<voltage>.root is written once at the end, with the same objects
+# the old chain left in it, next to the fit_<timestamp>_<voltage>.json read by timewalk.CalibrationStore.
+
+CHARGES = [5,15,20,30]
+COLORS = {5:'green',15:'blue',20:'red',30:'black'}
+
+# HM_left and width of every charge of a run from the qinj_results trees, (0, 0) if the run was not fitted
+def read_lines(file_data: dict, timecode: float):
+    lines = {charge: (0, 0) for charge in CHARGES}
+    for columns in file_data.values():
+        selected = columns['timestamp'] == timecode
+        for charge, width, HM_left in zip(columns['charge'][selected], columns['width'][selected], columns['HM_left'][selected]):
+            if int(charge) in lines:
+                lines[int(charge)] = (width, HM_left)
+    return lines
+
+# Draws a ToX vs Vth histogram with the HM_left and HM_left+width lines, returns the lines to keep them alive
+def draw_vth(hist: ROOT.TH2D, HM_left: float, width: float, y_low: float, y_high: float):
+    hist.Draw('COLZ')
+    left = ROOT.TLine(HM_left,y_low,HM_left,y_high)
+    right = ROOT.TLine(HM_left+width,y_low,HM_left+width,y_high)
+    for line, color in ((left, ROOT.kGreen), (right, ROOT.kRed)):
+        line.SetLineWidth(2)
+        line.SetLineColor(color)
+        line.Draw('same')
+    return left, right
+
+# Gaussian fit of a ToA distribution, returns the TFitResult (may be invalid)
+def fit_gaus(hist: ROOT.TH1, name: str, x_low: float, x_high: float):
+    fitfunc = get_model("gaus", x_low, x_high, name)
+    return hist.Fit(fitfunc,'RS')
+
+# Analysis of one run: returns the objects to write in its ROOT file, the time walk fits, the ToA mean and sigma per charge
+# and the lines drawn on the canvases, which must live until the canvases are saved
+def process_run(scan_dir: str, lines: dict, module: int, fast: bool, canvases: dict, axes: tuple):
+    objects = []
+    jdict = {}
+    distrib = {}
+    drawn = []
+    ToA_mean, ToT_mean = axes
+    for j, charge in enumerate(CHARGES):
+        timebin = 1.    # Find correct value
+        width, HM_left = lines[charge]
+        # Decode the scan once, every histogram below is filled from these arrays
+        data = load_scan(f"{scan_dir}/Qinj_scan_ETROC_0_L1A_501_{charge}.json")
+        datatoa = decode_toa(Ragged.from_scan(data, 'toa'), timebin)
+        datatot = decode_tot(Ragged.from_scan(data, 'tot'), timebin)
+        toa_flat = datatoa.values
+        tot_flat = datatot.values
+        vth_a = datatoa.vth_flat
+        vth_t = datatot.vth_flat
+        (mean_a, mean_t), (std_a, std_t), count_at, vth_mean = ragged_stats(datatoa, datatot)
+        endpoint = 800 if charge == 5 else 450
+        toa_low, toa_high = np.min(toa_flat), max(np.max(toa_flat),800)
+        tot_low, tot_high = np.min(tot_flat), max(np.max(tot_flat),250)
+        vth_low = min(np.min(vth_a),HM_left-20)
+        vth_high = max(np.max(vth_a),HM_left+width+20)
+
+        # ToA and ToT vs Vth before the correction
+        hist_toa_vth = ROOT.TH2D(f'toa_vth_{charge}',f'Charge: {charge}fC\t ',100,vth_low,vth_high,100,toa_low,toa_high)
+        fill_th2(hist_toa_vth, vth_a, toa_flat)
+        hist_toa_vth.GetXaxis().SetTitle('Vth (a.u.)')
+        hist_toa_vth.GetYaxis().SetTitle('ToA (a.u.)')
+        canvases['vth'].cd(j+1)
+        drawn += draw_vth(hist_toa_vth, HM_left, width, toa_low, toa_high)
+        hist_tot_vth = ROOT.TH2D(f'tot_vth_{charge}',f'Charge: {charge}fC',100,min(np.min(vth_t),HM_left-20),max(np.max(vth_t),HM_left+width+20),100,tot_low,tot_high)
+        fill_th2(hist_tot_vth, vth_t, tot_flat)
+        hist_tot_vth.GetXaxis().SetTitle('Vth (a.u.)')
+        hist_tot_vth.GetYaxis().SetTitle('ToT (a.u.)')
+        for canvas in (canvases['vth'], canvases['vth_corrected']):
+            canvas.cd(j+5)
+            drawn += draw_vth(hist_tot_vth, HM_left, width, tot_low, tot_high)
+
+        # Mean ToA and ToT for any given Vth
+        ToA_mean.plot(vth_mean,mean_a,color=COLORS[charge],label=f'{charge} fC')
+        ToA_mean.set_xlabel("Vth")
+        ToA_mean.set_ylabel("ToA_mean")
+        ToT_mean.plot(vth_mean,mean_t,color=COLORS[charge],label=f'{charge} fC')
+        ToT_mean.set_xlabel("Vth")
+        ToT_mean.set_ylabel("ToT_mean")
+
+        # ToA vs ToT and its time walk fit, on a cleaned copy so the saved histogram keeps all the hits
+        hist_toa_tot = ROOT.TH2D(f'toa_tot_{charge}',f'Charge: {charge}fC',100,tot_low,tot_high,100,toa_low,max(np.max(toa_flat),endpoint))
+        fill_th2(hist_toa_tot, tot_flat, toa_flat)
+        hist_toa_tot.GetXaxis().SetTitle('ToT (a.u)')
+        hist_toa_tot.GetYaxis().SetTitle('ToA (a.u)')
+        canvases['toa_tot'].cd(j+1)
+        hist_toa_tot.DrawCopy('COLZ')
+        hist_clean = hist_toa_tot.Clone(f'toa_tot_{charge}_clean')
+        jdict[charge], profile, fit_result = fit_timewalk(hist_clean, charge, module, fast)
+        objects += [(hist_toa_vth, f'toa_vth_{charge}'), (hist_tot_vth, f'tot_vth_{charge}'), (hist_toa_tot, f'toa_tot_{charge}'),
+                    (profile, f'toa_tot_{charge}_prof')]
+        if fit_result is not None:
+            objects.append((fit_result, f'toa_tot_{charge}_fit'))
+
+        # Time walk correction of the same hits
+        toa_corr = correct_toa(toa_flat, tot_flat, jdict[charge]['parval'])
+        hist_corr = ROOT.TH2D(f'toa_vth_{charge}_Corrected',f'Charge: {charge}fC\t Corrected',100,vth_low,vth_high,100,toa_low,toa_high)
+        fill_th2(hist_corr, vth_a, toa_corr)
+        hist_corr.GetXaxis().SetTitle('Vth (a.u.)')
+        hist_corr.GetYaxis().SetTitle('ToA (a.u.)')
+        canvases['vth_corrected'].cd(j+1)
+        drawn += draw_vth(hist_corr, HM_left, width, toa_low, toa_high)
+        objects.append((hist_corr, f'toa_vth_{charge}_Corrected'))
+
+        # Corrected ToA distribution between HM_left and HM_left+width, its mean and sigma go to fit_results.json
+        canvases['distrib'].cd(j+1)
+        firstproj = int(hist_corr.GetXaxis().FindBin(HM_left))
+        lastproj = int(hist_corr.GetXaxis().FindBin(HM_left+width))
+        toa_window = hist_corr.ProjectionY(f'toa_window_{charge}', firstproj, lastproj)
+        toa_window.DrawCopy()
+        endfit = 250. if module==43 else 400.
+        fit_result = fit_gaus(toa_window, f'gaus_toa_{charge}', 100., endfit)
+        try:
+            distrib[charge] = (fit_result.Parameter(1), fit_result.Parameter(2))
+            objects.append((fit_result, f'fit_c{charge}'))
+        except:
+            print(f'Error saving fit results for charge {charge}')
+            distrib[charge] = (0., 0.)
+        # Corrected ToA distribution over the whole Vth range
+        toa_distr = hist_corr.ProjectionY(f'toa_distrib_{charge}')
+        fit_gaus(toa_distr, 'fitfunc', 100., 250. if module==43 else 300.)
+        objects.append((toa_distr, f'toa_distrib_{charge}'))
+    return objects, jdict, distrib, drawn
+
+# Main part of the script
+if __name__ == "__main__":
+    argParser = argparse.ArgumentParser(description='Fill, fit and correct the ToA/ToT histograms of one sensor in a single pass')
+    argParser.add_argument('--sens', action='store', default='FBK_10e14', type=str, help='Sensor to analyze between FBK_0e14/6e14/10e14/15e14')
+    argParser.add_argument('--fast', action='store_true', default=False, help='Fit the time walk with the closed-form NumPy pol2 fit instead of Minuit')
+    argParser.add_argument('--compression', action='store', default=DEFAULT_COMPRESSION, type=str, help='Compression of the output ROOT files as algorithm:level')
+    args = argParser.parse_args()
+    start_time = time.time()
+    ROOT.gROOT.SetBatch(True)
+    ROOT.gStyle.SetOptStat(0)
+    # Histograms stay in memory until the output file is written
+    ROOT.TH1.AddDirectory(False)
+    sens = args.sens
+    timestamps = SENSORS[sens]['timestamps']
+    module = SENSORS[sens]['module']
+    dirpath = f"./module_test/outputs/{module}/"
+    respath = dirpath.replace("outputs","results")
+    run_index = RunIndex()
+    runs = run_index.runs(respath)
+    run_index.save()
+
+    # HM_left and width of the runs, from the qinj_results trees
+    file_data = {}
+    for file_name in find_root_files(kind='qinj'):
+        columns = read_results(file_name, columns=("charge", "width", "HM_left", "timestamp"))
+        if columns is None:
+            print(f"Tree 'qinj_results' not found in {file_name}")
+            continue
+        file_data[file_name] = columns
+
+    outdict = {'voltages': []}
+    outdict.update({charge: {'means': [], 'sigmas': []} for charge in CHARGES})
+    os.makedirs(f'ToA_ToT/{sens}', exist_ok=True)
+    for timestamp in timestamps:
+        voltage, temperature, pixel, fluence = runs[timestamp]
+        outdict['voltages'].append(voltage)
+        timecode = datetime.timestamp(datetime.strptime(timestamp,"%Y-%m-%d-%H-%M-%S"))
+        canvases = {
+            'vth': ROOT.TCanvas('canv1','canv1',2000,1000),
+            'vth_corrected': ROOT.TCanvas('canv2','canv2',2000,1000),
+            'toa_tot': ROOT.TCanvas('canv3','canv3',1400,1050),
+            'distrib': ROOT.TCanvas('canv4','canv4',1400,1050),
+        }
+        canvases['vth'].Divide(4,2)
+        canvases['vth_corrected'].Divide(4,2)
+        canvases['toa_tot'].Divide(2,2)
+        canvases['distrib'].Divide(2,2)
+        fig2, (ToA_mean,ToT_mean) = plt.subplots(1,2,figsize=(16,9),dpi=300)
+        objects, jdict, distrib, drawn = process_run(dirpath+timestamp, read_lines(file_data, timecode), module, args.fast, canvases, (ToA_mean,ToT_mean))
+        for charge in CHARGES:
+            outdict[charge]['means'].append(distrib[charge][0])
+            outdict[charge]['sigmas'].append(distrib[charge][1])
+
+        if not voltage:
+            voltage = "?"
+        if not fluence:
+            fluence = "0e14"
+        outdir = f"ToA_ToT/FBK_{fluence}"
+        os.makedirs(outdir, exist_ok=True)
+        # Outputs of the run, each written once
+        with RootOutput(f'{outdir}/{timestamp}_{voltage}.root', args.compression) as rootfile:
+            for obj, name in objects:
+                rootfile.add(obj, name)
+        with open(f'{outdir}/fit_{timestamp}_{voltage}.json','w') as json_file:
+            json.dump(jdict, json_file, indent=4)
+
+        ToA_mean.legend()
+        ToT_mean.legend()
+        fig2.suptitle(f"{timestamp} \n Pixel:{pixel} Bias:{voltage} Temp:{temperature} Fluence:{fluence}")
+        prefix = f"{outdir}/{timestamp}_mod{module}_bias{voltage}_f{fluence}"
+        for canvas in canvases.values():
+            canvas.SetLogz()
+            canvas.Update()
+        canvases['vth'].SaveAs(f"{prefix}_hist2d.png")
+        canvases['vth_corrected'].SaveAs(f"{prefix}_corrected_hist2d.png")
+        fig2.savefig(f"{prefix}_mean.png",dpi=300)
+        plt.close(fig2)
+        canvases['toa_tot'].SaveAs(f"{prefix}_ToAvsToT.png")
+        canvases['distrib'].SaveAs(f"{prefix}_DistribToA.png")
+        for canvas in canvases.values():
+            canvas.Close()
+
+    with open(f'ToA_ToT/{sens}/fit_results.json','w') as jsonout:
+        json.dump(outdict, jsonout, indent=4)
+    print(f"Saved all the outputs of {sens} in ToA_ToT/")
+    print(f"Execution time: {time.time() - start_time:.3f} seconds")
@@ -1,89 +1,62 @@
 import json
 import os
+import argparse
 import ROOT
 import numpy as np
-from re import search
-from time import mktime
 from datetime import datetime
 import matplotlib.pyplot as plt
-import math
-import statistics
+from scan_cache import load_scan
+from ragged import Ragged, ragged_stats
+from timewalk import CalibrationStore
+from hist_tools import fill_th2
+from results_io import read_results
+from results_catalog import find_root_files
+from run_index import RunIndex
+from root_output import RootOutput, DEFAULT_COMPRESSION
+from fit_models import get_model
 
-#Evaluate mean and std dev of ToA or ToT at each value of Vth
-def eval_list(data, datavth):
-    mean = []
-    devstd = []
-    vth = []
-    l = []
-    for i, sublist in enumerate(data):
-        if len(sublist)>0:
-            mean.append(sum(sublist)/len(sublist))
-            std = 0
-            vth.append(datavth[i])
-            for item in sublist:
-                l.append(item)
-                std += ((item-mean[-1])**2)/len(sublist)
-            devstd.append(math.sqrt(std))
-    return mean, devstd, vth, l
-
-# Finding ROOT files in directories
-def find_root_files_in_directories():
-    root_files = []
-    current_dir = os.getcwd()
-
-    for dirpath, dirnames, filenames in os.walk(current_dir):
-        if dirpath != current_dir:
-            for file in filenames:
-                if file.endswith(".root"):
-                    full_path = os.path.join(dirpath, file)
-                    root_files.append(full_path)
-
-    return root_files
-
-# Extract information about the experimental condition from file name
-def extract_info(s: str):
-    voltage_match = search(r'(\d+V)', s)
-    voltage = voltage_match.group(1) if voltage_match else None
-
-    temperature_match = search(r'(-?\d+C)', s)
-    temperature = temperature_match.group(1) if temperature_match else None
-
-    pixel_match = search(r'(\d+-\d+)', s)
-    pixel = pixel_match.group(1) if pixel_match else None
-
-    fluence_match = search(r'(\d+e\d+)', s)
-    fluence = fluence_match.group(0) if fluence_match else '0e14'
-
-    return voltage, temperature, pixel, fluence
+# Timestamps and module of the runs of every sensor
+SENSORS = {
+    'FBK_15e14': {
+        'timestamps': ["2024-10-11-10-08-23","2024-10-11-10-26-15","2024-10-11-10-34-44","2024-10-11-10-48-25","2024-10-11-11-04-02","2024-10-11-11-15-51","2024-10-11-11-27-32","2024-10-11-11-38-40","2024-10-11-11-49-17","2024-10-11-12-00-52"],
+        'module': 43
+    },
+    'FBK_10e14': {
+        'timestamps': ["2024-10-10-15-00-22","2024-10-10-15-23-42","2024-10-10-15-43-55","2024-10-10-16-00-51","2024-10-10-16-16-17","2024-10-10-17-57-44","2024-10-10-18-09-56"],
+        'module': 21
+    },
+    'FBK_6e14': {
+        'timestamps': ["2024-10-01-17-09-52","2024-10-01-15-36-16","2024-10-01-15-45-50","2024-10-01-16-03-51","2024-10-01-16-13-50","2024-10-01-16-23-04","2024-10-01-16-37-34"],
+        'module': 21
+    },
+    'FBK_0e14': {
+        'timestamps': ["2024-10-01-11-55-39","2024-10-01-12-07-27","2024-10-01-12-16-44","2024-10-01-12-28-02","2024-10-01-12-37-39", "2024-10-01-12-48-40", "2024-10-01-13-00-17"],
+        'module': 43
+    }
+}
 
-# Search for the correct timestamp in the directory
-def find_info(respath, timestamp):
-    dirlist = os.listdir(respath)
-    for dir in dirlist:
-        if timestamp in dir:
-            voltage, temperature, pixel, fluence = extract_info(dir.replace(timestamp,""))
-            return voltage, temperature, pixel, fluence
+# Convert the raw ToA and ToT codes of the hits
+def decode_toa(toa: Ragged, timebin: float):
+    return toa.with_values(12.5-timebin*toa.values)
 
-# Make plots applying ToA correction for different ToT values
-def correct_toa(toa_flat: np.array, tot_flat: np.array, vth_a: np.array, vth_t: np.array, timestamp: str, fluence: str, voltage: str, charge: int):
-    with open(f'ToA_ToT/FBK_{fluence}/fit_{timestamp}_{voltage}.json','r') as jfile:
-        data = json.load(jfile)
-    parname = data[str(charge)]['parname']
-    parval = data[str(charge)]['parval']
-    parerr = data[str(charge)]['parerr']
-    toa_flat_corr = []
-    for iter in range(len(toa_flat)):
-        toa_flat_corr.append(toa_flat[iter] - parval[1]*tot_flat[iter] - parval[2]*tot_flat[iter]*tot_flat[iter])
-    return toa_flat_corr
+def decode_tot(tot: Ragged, timebin: float):
+    return tot.with_values((2*tot.values - np.floor(tot.values/32))*timebin)
 
 # Main part of the script
 if __name__ == "__main__":
+    argParser = argparse.ArgumentParser(description='Fill and fit the ToA/ToT histograms of one sensor')
+    argParser.add_argument('--sens', action='store', default='FBK_10e14', type=str, help='Sensor to analyze between FBK_0e14/6e14/10e14/15e14')
+    argParser.add_argument('--no_correct', action='store_true', default=False, help='Do not apply the time walk correction (first pass, before fit_correction.py)')
+    argParser.add_argument('--compression', action='store', default=DEFAULT_COMPRESSION, type=str, help='Compression of the output ROOT files as algorithm:level')
+    args = argParser.parse_args()
     ROOT.gStyle.SetOptStat(0)
-    root_files = find_root_files_in_directories()
+    root_files = find_root_files(kind='qinj')
     # Decide wether to apply time walk correction or not
-    correct_bool = True
+    correct_bool = not args.no_correct
+    # Load all the time walk calibrations once
+    calibrations = CalibrationStore('ToA_ToT') if correct_bool else None
     # Decide sensor to analyze between FBK_0e14/6e14/10e14/15e14
-    sens = 'FBK_10e14'
+    sens = args.sens
     # Initialize a dictionary to store data by file
     file_data = {}
     outdict = {
@@ -124,59 +97,36 @@ if __name__ == "__main__":
             "timestamp": [],
         }
 
-        file = ROOT.TFile(file_name)
-        tree = file.Get("qinj_results")
+        # Read all the branches of the tree as NumPy arrays in one call
+        columns = read_results(file_name, columns=("charge", "width", "HM_left", "timestamp"))
 
-        if not tree:
+        if columns is None:
             print(f"Tree 'qinj_results' not found in {file_name}")
             continue 
 
-        for entry in tree:
-            # Append data to the lists within the dictionary for this file
-            file_data[file_name]["charge"].append(entry.charge)
-            file_data[file_name]["width"].append(entry.width)
-            file_data[file_name]["HM_left"].append(entry.HM_left)
-            file_data[file_name]["timestamp"].append(entry.timestamp)
-
-        file.Close()   
+        file_data[file_name].update(columns)
 
     colors = {5:'green',15:'blue',20:'red',30:'black'}
     charges = [5,15,20,30]
 
-    # Choose sensor from dictionary to set correct timestamps and module
-    dictsens = {
-        'FBK_15e14': {
-            'timestamps': ["2024-10-11-10-08-23","2024-10-11-10-26-15","2024-10-11-10-34-44","2024-10-11-10-48-25","2024-10-11-11-04-02","2024-10-11-11-15-51","2024-10-11-11-27-32","2024-10-11-11-38-40","2024-10-11-11-49-17","2024-10-11-12-00-52"],
-            'module': 43
-        },
-        'FBK_10e14': {
-            'timestamps': ["2024-10-10-15-00-22","2024-10-10-15-23-42","2024-10-10-15-43-55","2024-10-10-16-00-51","2024-10-10-16-16-17","2024-10-10-17-57-44","2024-10-10-18-09-56"],
-            'module': 21
-        },
-        'FBK_6e14': {
-            'timestamps': ["2024-10-01-17-09-52","2024-10-01-15-36-16","2024-10-01-15-45-50","2024-10-01-16-03-51","2024-10-01-16-13-50","2024-10-01-16-23-04","2024-10-01-16-37-34"],
-            'module': 21
-        },
-        'FBK_0e14': {
-            'timestamps': ["2024-10-01-11-55-39","2024-10-01-12-07-27","2024-10-01-12-16-44","2024-10-01-12-28-02","2024-10-01-12-37-39", "2024-10-01-12-48-40", "2024-10-01-13-00-17"],
-            'module': 43
-        }
-    }
-    
-    timestamps = dictsens[sens]['timestamps']
-    timecode = [datetime.timestamp(datetime.strptime(timestamp,"%Y-%m-%d-%H-%M-%S")) for timestamp in timestamps]
-    module = dictsens[sens]['module']
+    timestamps = SENSORS[sens]['timestamps']
+    module = SENSORS[sens]['module']
     dirpath = f"./module_test/outputs/{module}/"
     respath = dirpath.replace("outputs","results")
-    timecode.sort()
+    # Run conditions of every timestamp, from the cached index of the results directory
+    run_index = RunIndex()
+    runs = run_index.runs(respath)
+    run_index.save()
     data = []
     counts = []
     bins = []
-    for time_i, timestamp in enumerate(timestamps):
+    for timestamp in timestamps:
         rootdata = []
+        # Time code of the timestamp, as stored in the qinj results
+        timecode = datetime.timestamp(datetime.strptime(timestamp,"%Y-%m-%d-%H-%M-%S"))
         # Extract data from rootfiles and select the file with the current timestamp
         for file_name, dataitem in file_data.items():
-            if timecode[time_i] in dataitem['timestamp']:
+            if timecode in dataitem['timestamp']:
                 rootdata = list(zip(*dataitem.values()))
         # Prepare canvas and lists for analysis
         canv1 = ROOT.TCanvas('canv1','canv1',2000,1000)
@@ -186,9 +136,10 @@ if __name__ == "__main__":
         canv3.Divide(2,2)
         canv4 = ROOT.TCanvas('canv4','canv4',1400,1050)
         canv4.Divide(2,2)
-        voltage, temperature, pixel, fluence = find_info(respath, timestamp)
+        voltage, temperature, pixel, fluence = runs[timestamp]
         outdict['voltages'].append(voltage)
-        rootfile = ROOT.TFile(f'ToA_ToT/FBK_{fluence}/{timestamp}_{voltage}.root','UPDATE')
+        # Objects of the run, written once after the loop keeping the ones saved by the other scripts
+        rootfile = RootOutput(f'ToA_ToT/FBK_{fluence}/{timestamp}_{voltage}.root', args.compression, update=True)
         hist_toa_vth = []
         hist_tot_vth = []
         #hist_toa_tot = []
@@ -202,40 +153,35 @@ if __name__ == "__main__":
             HM_left = 0
             # Extract width and HM_left to draw lines
             for elements in rootdata:
-                if elements[0] == charge and elements[3] == timecode[time_i]:
+                if elements[0] == charge and elements[3] == timecode:
                     width = elements[1]
                     HM_left = elements[2] 
-            # Read data from JSON file and manipulate into NUMPY arrays
+            # Read data from the binary cache of the JSON file (flat hit arrays plus per-Vth offsets)
             file = f"Qinj_scan_ETROC_0_L1A_501_{charge}.json"
-            with open(dirpath+timestamp+'/'+file, 'r') as f:
-                data = json.load(f)
-            datatoa = 12.5-timebin*data['toa']
-            datatot = ((2*data['tot'] - np.floor(data['tot']/32))*timebin)
-            datavth = data['vth']
-            toa_flat = np.array([item for sublist in datatoa for item in sublist])
-            tot_flat = np.array([item for sublist in datatot for item in sublist])
-            vth_a = np.repeat(datavth, [len(sublist) for sublist in datatoa])
-            vth_t = np.repeat(datavth, [len(sublist) for sublist in datatoa])
-            mean_a, std_a, vth_amean, list_a = eval_list(datatoa, datavth)
-            mean_t, std_t, vth_tmean, list_t = eval_list(datatot, datavth)
+            data = load_scan(dirpath+timestamp+'/'+file)
+            datatoa = decode_toa(Ragged.from_scan(data, 'toa'), timebin)
+            datatot = decode_tot(Ragged.from_scan(data, 'tot'), timebin)
+            toa_flat = datatoa.values
+            tot_flat = datatot.values
+            vth_a = datatoa.vth_flat
+            vth_t = datatot.vth_flat
+            # Per-Vth mean and std dev of ToA and ToT in one pass over the hits
+            (mean_a, mean_t), (std_a, std_t), count_at, vth_amean = ragged_stats(datatoa, datatot)
+            vth_tmean = vth_amean
             if correct_bool:
-                toa_flat_corr = correct_toa(toa_flat,tot_flat,vth_a,vth_t,timestamp,fluence,voltage,charge)
+                toa_flat_corr = calibrations.correct(toa_flat,tot_flat,(fluence,timestamp,voltage,charge))
             if charge == 5:
                 endpoint = 800
             else:
                 endpoint = 450
             # Fill 2D histograms for ToX vs Vth
             canv1.cd(j+1)
-            hist_toa_vth.append(ROOT.TH2D(f"toa_vth_{charge}{'_Corrected' if correct_bool else ''}",f'Charge: {charge}fC\t {'Corrected' if correct_bool else ''}',100,min(np.min(vth_a),HM_left-20),max(np.max(vth_a),HM_left+width+20),100,np.min(toa_flat),max(np.max(toa_flat),800)))
-            for iter in range(len(vth_a)):
-                if correct_bool:
-                    hist_toa_vth[j].Fill(vth_a[iter],toa_flat_corr[iter])                
-                else:
-                    hist_toa_vth[j].Fill(vth_a[iter],toa_flat[iter])
+            hist_toa_vth.append(ROOT.TH2D(f"toa_vth_{charge}{'_Corrected' if correct_bool else ''}",f'Charge: {charge}fC\t {"Corrected" if correct_bool else ""}',100,min(np.min(vth_a),HM_left-20),max(np.max(vth_a),HM_left+width+20),100,np.min(toa_flat),max(np.max(toa_flat),800)))
+            fill_th2(hist_toa_vth[j], vth_a, toa_flat_corr if correct_bool else toa_flat)
             hist_toa_vth[j].GetXaxis().SetTitle('Vth (a.u.)')
             hist_toa_vth[j].GetYaxis().SetTitle('ToA (a.u.)')
             hist_toa_vth[j].Draw('COLZ')
-            hist_toa_vth[j].Write(f"toa_vth_{charge}{'_Corrected' if correct_bool else ''}",ROOT.TObject.kOverwrite)
+            rootfile.add(hist_toa_vth[j], f"toa_vth_{charge}{'_Corrected' if correct_bool else ''}")
             lineLeftA.append(ROOT.TLine(HM_left,np.min(toa_flat),HM_left,max(np.max(toa_flat),800)))
             lineWidthA.append(ROOT.TLine(HM_left+width,np.min(toa_flat),HM_left+width,max(np.max(toa_flat),800)))
             lineLeftA[j].SetLineWidth(2)
@@ -246,12 +192,11 @@ if __name__ == "__main__":
             lineWidthA[j].Draw('same')
             canv1.cd(j+5)
             hist_tot_vth.append(ROOT.TH2D(f'tot_vth_{charge}',f'Charge: {charge}fC',100,min(np.min(vth_t),HM_left-20),max(np.max(vth_t),HM_left+width+20),100,np.min(tot_flat),max(np.max(tot_flat),250)))
-            for iter in range(len(vth_t)):
-                hist_tot_vth[j].Fill(vth_t[iter],tot_flat[iter])
+            fill_th2(hist_tot_vth[j], vth_t, tot_flat)
             hist_tot_vth[j].GetXaxis().SetTitle('Vth (a.u.)')
             hist_tot_vth[j].GetYaxis().SetTitle('ToT (a.u.)')
             hist_tot_vth[j].Draw('COLZ')
-            hist_tot_vth[j].Write(f'tot_vth_{charge}',ROOT.TObject.kOverwrite)
+            rootfile.add(hist_tot_vth[j], f'tot_vth_{charge}')
             lineLeftT.append(ROOT.TLine(HM_left,np.min(tot_flat),HM_left,max(np.max(tot_flat),250)))
             lineWidthT.append(ROOT.TLine(HM_left+width,np.min(tot_flat),HM_left+width,max(np.max(tot_flat),250)))
             lineLeftT[j].SetLineWidth(2)
@@ -273,38 +218,33 @@ if __name__ == "__main__":
             # Fill 2D histograms for ToA vs ToT
             canv3.cd(j+1)
             hist_toa_tot = ROOT.TH2D(f'toa_tot_{charge}',f'Charge: {charge}fC',100,(np.min(tot_flat)),max(np.max(tot_flat),250),100,np.min(toa_flat),max(np.max(toa_flat),endpoint))
-            for iter in range(len(tot_flat)):
-                hist_toa_tot.Fill(tot_flat[iter],toa_flat[iter])
+            fill_th2(hist_toa_tot, tot_flat, toa_flat)
             hist_toa_tot.GetXaxis().SetTitle('ToT (a.u)')
             hist_toa_tot.GetYaxis().SetTitle('ToA (a.u)')
             hist_toa_tot.DrawCopy('COLZ')
-            hist_toa_tot.Write(f'toa_tot_{charge}',ROOT.TObject.kOverwrite)
+            rootfile.add(hist_toa_tot, f'toa_tot_{charge}')
             canv3.SetLogz()
             canv3.Update()
             canv4.Draw()
             if correct_bool:
                 # Fill 1D histograms to measure distribution of ToA after correction (time res??)
-                try:
-                    rootfile.Delete(f'toa_distrib_{charge}')
-                except:
-                    print('\n\nError deleting histogram\n\n')
                 canv4.cd(j+1)
                 firstproj = int(hist_toa_vth[j].GetXaxis().FindBin(HM_left))
                 lastproj = int(hist_toa_vth[j].GetXaxis().FindBin(HM_left+width))
                 toatemp = hist_toa_vth[j].ProjectionY(f'toa_distrib_{charge}', firstproj, lastproj)
                 toatemp.DrawCopy()
                 endfit = 250. if module==43 else 400.
-                fitfunc = ROOT.TF1(f'gaus_toa_{charge}','gaus(0)',100.,endfit)
+                fitfunc = get_model("gaus", 100., endfit, f'gaus_toa_{charge}')
                 fit_result = toatemp.Fit(fitfunc,'RS')
                 try:
                     outdict[charge]['means'].append(fit_result.Parameter(1))
                     outdict[charge]['sigmas'].append(fit_result.Parameter(2))
-                    fit_result.Write(f'fit_c{charge}',ROOT.TObject.kOverwrite)
+                    rootfile.add(fit_result, f'fit_c{charge}')
                 except:
                     print(f'Error saving fit results for {fluence}_{voltage}_{charge}')
                     outdict[charge]['means'].append(0.)
                     outdict[charge]['sigmas'].append(0.)
-                toatemp.Write(f'toa_distrib_{charge}',ROOT.TObject.kOverwrite)
+                rootfile.add(toatemp, f'toa_distrib_{charge}')
                 
         
         ToA_mean.legend()
@@ -324,7 +264,7 @@ if __name__ == "__main__":
         canv1.Close()
         canv3.Close()
         canv4.Close()
-        rootfile.Close()
+        rootfile.write()
     if correct_bool:
         with open(f'ToA_ToT/{sens}/fit_results.json','w') as jsonout:
             json.dump(outdict, jsonout, indent=4)